@@ -0,0 +1,30 @@
+'''
+Load benchmarks driving the API in-process against a synthetic dataset.
+
+Generate a dataset with `python -m benchmarks.dataset`, then run `python -m benchmarks.run`.
+'''
+import os
+
+DEFAULT_DB = 'unirest_bench'
+
+
+def setup(db=DEFAULT_DB, event_listeners=()):
+    '''
+    Set up Django, and point the default mongoengine connection at db
+    with the same host and options as the configured one, adding event_listeners to the client.
+    '''
+    # Imported here so that benchmarks.boot measures their import
+    import django
+    from mongoengine import connection
+
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'unirest.settings')
+    django.setup()
+
+    from unirest.mongo import reset_collections
+
+    conn_settings = dict(connection._connection_settings[connection.DEFAULT_CONNECTION_NAME])
+    conn_settings['name'] = db
+    conn_settings['event_listeners'] = list(conn_settings.get('event_listeners', ())) + list(event_listeners)
+    connection.disconnect()
+    connection.register_connection(connection.DEFAULT_CONNECTION_NAME, **conn_settings)
+    reset_collections()
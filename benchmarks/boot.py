@@ -0,0 +1,189 @@
+'''
+Boot a worker the way the WSGI server does and report where the time goes: per boot phase, and per imported
+module, inclusive of the modules it imports and by itself.
+
+    $ python -m benchmarks.boot --settings unirest.settings_production --top 30 --output boot.json
+
+Run it in a fresh process, modules imported before it are not measured. With --check it fails if booting
+connected to mongo or started threads, which preforked workers would not inherit.
+'''
+import argparse
+import json
+import os
+import platform
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+import six
+from six.moves import builtins
+
+# Python 2 leaves the level out of implicit relative imports
+DEFAULT_LEVEL = -1 if six.PY2 else 0
+
+
+def _loaded(name):
+    # Failed implicit relative imports of python 2 leave None in sys.modules
+    return sys.modules.get(name) is not None
+
+
+class ImportProfiler(object):
+    '''
+    Times the first import of every module by wrapping __import__.
+    '''
+
+    def __init__(self):
+        self.modules = OrderedDict()
+        self._import = None
+        self._children = []
+
+    def install(self):
+        self._import = builtins.__import__
+        builtins.__import__ = self._timed_import
+
+    def uninstall(self):
+        builtins.__import__ = self._import
+
+    def _module_name(self, name, globals_, level):
+        if level == 0 or not globals_:
+            return name
+        # Relative imports, implicit ones of python 2 included
+        package = globals_.get('__package__')
+        if not package:
+            package = globals_.get('__name__', '')
+            if '__path__' not in globals_:
+                package = package.rpartition('.')[0]
+        if level > 1:
+            package = package.rsplit('.', level - 1)[0]
+        return '%s.%s' % (package, name) if name else package
+
+    def _timed_import(self, name, globals_=None, locals_=None, fromlist=(), level=DEFAULT_LEVEL):
+        module_name = self._module_name(name, globals_, level)
+        if _loaded(module_name) or (level < 0 and _loaded(name)):
+            return self._import(name, globals_, locals_, fromlist, level)
+
+        self._children.append(0.0)
+        started = time.time()
+        try:
+            return self._import(name, globals_, locals_, fromlist, level)
+        finally:
+            elapsed = time.time() - started
+            children = self._children.pop()
+            if self._children:
+                self._children[-1] += elapsed
+            if not _loaded(module_name) and _loaded(name):
+                module_name = name
+            if _loaded(module_name) and module_name not in self.modules:
+                self.modules[module_name] = (elapsed, elapsed - children)
+
+    def top(self, count):
+        ranked = sorted(self.modules.items(), key=lambda item: -item[1][1])[:count]
+        return OrderedDict((name, OrderedDict([('inclusive_ms', inclusive * 1000), ('self_ms', own * 1000)]))
+                           for name, (inclusive, own) in ranked)
+
+
+def boot(schema=False):
+    '''
+    Run the boot phases of a worker, returning their durations.
+    '''
+    phases = OrderedDict()
+
+    def phase(name, function):
+        started = time.time()
+        function()
+        phases[name] = time.time() - started
+
+    def load_settings():
+        from django.conf import settings
+        return settings.INSTALLED_APPS
+
+    def setup():
+        import django
+        django.setup(set_prefix=False)
+
+    def load_urls():
+        from django.urls import get_resolver
+        return get_resolver().url_patterns
+
+    def load_application():
+        # The WSGI_APPLICATION module, as the WSGI server imports it
+        from django.conf import settings
+        from django.utils.module_loading import import_string
+        return import_string(settings.WSGI_APPLICATION)
+
+    def build_schema():
+        from unirest.schema import get_schema
+        return get_schema()
+
+    phase('settings', load_settings)
+    phase('django_setup', setup)
+    phase('urlconf', load_urls)
+    phase('wsgi_application', load_application)
+    if schema:
+        phase('schema', build_schema)
+    return phases
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--settings', default=os.environ.get('DJANGO_SETTINGS_MODULE', 'unirest.settings'),
+                        help='Django settings module to boot with.')
+    parser.add_argument('--schema', action='store_true',
+                        help='Also load the OpenAPI schema, as the first request to /docs/ does.')
+    parser.add_argument('--top', type=int, default=20, help='Number of modules listed, slowest by self time first.')
+    parser.add_argument('--output', help='Write the results as JSON to this file.')
+    parser.add_argument('--check', action='store_true',
+                        help='Exit with an error if booting connected to mongo or started threads.')
+    args = parser.parse_args(argv)
+
+    os.environ['DJANGO_SETTINGS_MODULE'] = args.settings
+    threads = set(threading.enumerate())
+    profiler = ImportProfiler()
+    profiler.install()
+    try:
+        phases = boot(args.schema)
+    finally:
+        profiler.uninstall()
+
+    from mongoengine import connection
+
+    connected = bool(connection._connections)
+    started = sorted(thread.name for thread in set(threading.enumerate()) - threads)
+    total = sum(phases.values())
+    for name, elapsed in phases.items():
+        sys.stdout.write('%-28s %8.2fms\n' % (name, elapsed * 1000))
+    sys.stdout.write('%-28s %8.2fms  %d modules imported, mongo %s, %d threads started\n\n'
+                     % ('total', total * 1000, len(profiler.modules),
+                        'connected' if connected else 'not connected', len(started)))
+    modules = profiler.top(args.top)
+    sys.stdout.write('%-48s %10s %10s\n' % ('module', 'self', 'inclusive'))
+    for name, stats in modules.items():
+        sys.stdout.write('%-48s %8.2fms %8.2fms\n' % (name, stats['self_ms'], stats['inclusive_ms']))
+
+    if args.output:
+        from benchmarks.run import _revision
+
+        report = OrderedDict([
+            ('started', time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())),
+            ('revision', _revision()),
+            ('python', platform.python_version()),
+            ('settings', args.settings),
+            ('phases_ms', OrderedDict((name, elapsed * 1000) for name, elapsed in phases.items())),
+            ('total_ms', total * 1000),
+            ('modules_imported', len(profiler.modules)),
+            ('mongo_connected', connected),
+            ('threads_started', started),
+            ('modules', modules),
+        ])
+        with open(args.output, 'w') as output:
+            json.dump(report, output, indent=2)
+
+    if args.check and (connected or started):
+        sys.stderr.write('Booting connected to mongo or started threads: %s\n' % (', '.join(started) or 'none'))
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
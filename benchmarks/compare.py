@@ -0,0 +1,42 @@
+'''
+Compare two benchmark result files written by benchmarks.run.
+
+    $ python -m benchmarks.compare baseline.json results.json
+'''
+import argparse
+import json
+import sys
+
+METRICS = ('p50_ms', 'p95_ms', 'p99_ms', 'round_trips_mean')
+
+
+def _change(before, after):
+    if not before:
+        return '     n/a'
+    return '%+7.1f%%' % ((after - before) * 100.0 / before)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('baseline')
+    parser.add_argument('results')
+    args = parser.parse_args(argv)
+
+    with open(args.baseline) as baseline_file, open(args.results) as results_file:
+        baseline = json.load(baseline_file)['endpoints']
+        results = json.load(results_file)['endpoints']
+
+    sys.stdout.write('%-28s %s\n' % ('endpoint', ''.join('%30s' % metric for metric in METRICS)))
+    for name, after in sorted(results.items()):
+        before = baseline.get(name)
+        if before is None:
+            sys.stdout.write('%-28s new\n' % name)
+            continue
+        sys.stdout.write('%-28s %s\n' % (name, ''.join(
+            '%9.2f -> %8.2f %s' % (before[metric], after[metric], _change(before[metric], after[metric]))
+            for metric in METRICS)))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,154 @@
+'''
+Generate a synthetic dataset of courses and students with a skewed enrollment distribution.
+
+    $ python -m benchmarks.dataset --students 1000000 --courses 10000 --drop
+'''
+import argparse
+import bisect
+import random
+import sys
+import time
+
+from benchmarks import DEFAULT_DB, setup
+
+FACULTIES = ('Computer Science', 'Mathematics', 'Physics', 'Chemistry', 'Biology',
+             'Economics', 'History', 'Philosophy', 'Law', 'Medicine')
+SUBJECTS = ('Algebra', 'Calculus', 'Algorithms', 'Databases', 'Mechanics', 'Optics', 'Genetics',
+            'Ethics', 'Statistics', 'Topology', 'Microeconomics', 'Thermodynamics')
+FIRST_NAMES = ('Natalie', 'Adam', 'Noa', 'David', 'Maya', 'Yosef', 'Tamar', 'Daniel', 'Shira', 'Omer',
+               'Yael', 'Itai', 'Michal', 'Ariel', 'Roni', 'Eitan', 'Lior', 'Gal', 'Amit', 'Dana')
+LAST_NAMES = ('Cohen', 'Levi', 'Mizrahi', 'Peretz', 'Biton', 'Dahan', 'Avraham', 'Friedman',
+              'Azulay', 'Katz', 'Malka', 'Shapiro', 'Ohana', 'Goldberg', 'Rosen')
+CITIES = ('Haifa', 'Tel Aviv', 'Jerusalem', 'Beer Sheva', 'Netanya', 'Ashdod', 'Rishon LeZion',
+          'Petah Tikva', 'Holon', 'Eilat')
+# Relative frequency of course points, most courses are worth 3 or 4 points
+POINTS = ((1, 1), (2, 3), (3, 8), (4, 6), (5, 2), (6, 1))
+
+
+class WeightedChoice(object):
+    '''
+    Draws items with probability proportional to their weight in O(log n).
+    '''
+
+    def __init__(self, rng, items, weights):
+        self.rng = rng
+        self.items = list(items)
+        self.cumulative = []
+        total = 0
+        for weight in weights:
+            total += weight
+            self.cumulative.append(total)
+
+    def __call__(self):
+        return self.items[bisect.bisect(self.cumulative, self.rng.random() * self.cumulative[-1])]
+
+
+def generate_courses(rng, count):
+    points = WeightedChoice(rng, [p for p, _ in POINTS], [w for _, w in POINTS])
+    for index in range(count):
+        yield {'faculty': rng.choice(FACULTIES),
+               'subject': '%s %d' % (rng.choice(SUBJECTS), index),
+               'description': 'Synthetic course %d' % index,
+               'year': rng.randint(2010, 2017),
+               'semester': rng.choice('123'),
+               'points': points()}
+
+
+def generate_students(rng, count, courses, enrollments_mean, graded_ratio, skew):
+    '''
+    Yield student documents enrolled to about enrollments_mean courses each.
+
+    Course popularity follows a Zipf-like law with exponent skew, so a few courses have
+    most of the enrollments, and graded_ratio of the enrollments have a grade.
+    '''
+    from enrollments.models import Enrollment, average_fields
+
+    popular = WeightedChoice(rng, courses, [1.0 / (rank + 1) ** skew for rank in range(len(courses))])
+    for index in range(count):
+        name = '%s %s' % (rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES))
+        city = rng.choice(CITIES)
+        wanted = min(len(courses), max(0, int(round(rng.gauss(enrollments_mean, enrollments_mean / 3.0)))))
+        chosen = {}
+        while len(chosen) < wanted:
+            course = popular()
+            chosen[course['_id']] = course
+
+        weighted_sum = total_points = 0
+        enrollments = []
+        for course_id, course in chosen.items():
+            grade = None
+            if rng.random() < graded_ratio:
+                grade = max(0, min(100, int(rng.gauss(78, 12))))
+                weighted_sum += grade * course['points']
+                total_points += course['points']
+            enrollment = {'course': course_id, 'grade': grade}
+            enrollment.update((name, course[name]) for name in Enrollment.snapshot_fields)
+            enrollments.append(enrollment)
+
+        student = {'name': name,
+                   'city': city,
+                   'email': 'student%d@example.com' % index,
+                   'year_of_birth': rng.randint(1970, 2000),
+                   'enrollments': enrollments,
+                   'name_lower': name.lower(),
+                   'city_lower': city.lower()}
+        student.update(average_fields(weighted_sum, total_points))
+        yield student
+
+
+def insert_batched(collection, documents, batch_size):
+    inserted = 0
+    batch = []
+    for document in documents:
+        batch.append(document)
+        if len(batch) >= batch_size:
+            inserted += len(collection.insert_many(batch, ordered=False).inserted_ids)
+            batch = []
+    if batch:
+        inserted += len(collection.insert_many(batch, ordered=False).inserted_ids)
+    return inserted
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--db', default=DEFAULT_DB, help='Database to generate into.')
+    parser.add_argument('--students', type=int, default=100000)
+    parser.add_argument('--courses', type=int, default=1000)
+    parser.add_argument('--enrollments-mean', type=float, default=8,
+                        help='Average number of enrollments per student.')
+    parser.add_argument('--graded-ratio', type=float, default=0.8,
+                        help='Fraction of the enrollments that have a grade.')
+    parser.add_argument('--skew', type=float, default=1.0,
+                        help='Zipf exponent of course popularity, 0 for uniform.')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--batch-size', type=int, default=1000)
+    parser.add_argument('--drop', action='store_true', help='Drop existing courses and students first.')
+    args = parser.parse_args(argv)
+
+    setup(args.db)
+    from enrollments.models import Course, Student
+
+    courses_collection = Course._get_collection()
+    students_collection = Student._get_collection()
+    if args.drop:
+        courses_collection.delete_many({})
+        students_collection.delete_many({})
+    elif courses_collection.count() or students_collection.count():
+        sys.stderr.write('Database %s is not empty, pass --drop to replace its data\n' % args.db)
+        return 1
+
+    rng = random.Random(args.seed)
+    started = time.time()
+    courses = list(generate_courses(rng, args.courses))
+    insert_batched(courses_collection, courses, args.batch_size)
+    inserted = insert_batched(students_collection,
+                              generate_students(rng, args.students, courses, args.enrollments_mean,
+                                                args.graded_ratio, args.skew),
+                              args.batch_size)
+    sys.stdout.write('Generated %d courses and %d students into %s in %.1fs\n'
+                     % (len(courses), inserted, args.db, time.time() - started))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,310 @@
+'''
+Drive every API route in-process through the Django test client against a generated dataset,
+and report latency percentiles, throughput and Mongo round trips per endpoint.
+
+    $ python -m benchmarks.run --iterations 200 --output results.json
+
+Write routes change the dataset, regenerate it to compare runs from the same starting point.
+'''
+import argparse
+import json
+import math
+import platform
+import random
+import re
+import subprocess
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+from pymongo import monitoring
+
+from benchmarks import DEFAULT_DB, setup
+
+SCRATCH_FACULTY = 'Benchmark'
+SCRATCH_EMAIL = 'bench-%s@example.com'
+
+
+class RoundTripCounter(monitoring.CommandListener):
+    '''
+    Counts the commands sent to MongoDB.
+    '''
+
+    def __init__(self):
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def started(self, event):
+        with self._lock:
+            self.count += 1
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+
+class Endpoint(object):
+    '''
+    A benchmarked request. path and data may contain {placeholders} filled from the fixtures
+    returned by prepare, which runs before every request and is not measured.
+    '''
+
+    def __init__(self, name, method, path, data=None, content_type='application/json', prepare=None):
+        self.name = name
+        self.method = method
+        self.path = path
+        self.data = data
+        self.content_type = content_type
+        self.prepare = prepare
+
+
+class Fixtures(object):
+    '''
+    Samples existing documents and creates scratch ones for the benchmarked requests.
+    '''
+
+    def __init__(self, rng, sample_size=1000):
+        from enrollments.models import Course, Student
+
+        self.rng = rng
+        self.sequence = 0
+        self.course_ids = [str(pk) for pk in Course.objects(faculty__ne=SCRATCH_FACULTY).scalar('id')
+                           .limit(sample_size)]
+        self.student_ids = [str(pk) for pk in Student.objects.scalar('id').limit(sample_size)]
+        if not self.course_ids or not self.student_ids:
+            raise RuntimeError('The benchmark database is empty, generate it with `python -m benchmarks.dataset`')
+
+    def next(self):
+        self.sequence += 1
+        return self.sequence
+
+    def base(self):
+        student = self.rng.choice(self.student_ids)
+        return {'course': self.rng.choice(self.course_ids),
+                'student': student,
+                'name_prefix': self.rng.choice(('nat', 'ada', 'noa', 'dav', 'may')),
+                'sequence': self.next()}
+
+    def scratch_course(self, enrolled=0):
+        from enrollments.models import Course, Student
+
+        course = Course(faculty=SCRATCH_FACULTY, subject='Scratch %d' % self.next(), description='Scratch',
+                        year=2017, semester='1', points=3).save()
+        if enrolled:
+            Student.objects(id__in=self.rng.sample(self.student_ids, min(enrolled, len(self.student_ids)))) \
+                .enrol(course)
+        return course
+
+    def with_scratch_course(self, fixtures):
+        fixtures['scratch_course'] = str(self.scratch_course().pk)
+        return fixtures
+
+    def with_enrolled_scratch_course(self, fixtures):
+        from enrollments.models import Student
+
+        course = self.scratch_course(enrolled=100)
+        fixtures['scratch_course'] = str(course.pk)
+        fixtures['rows'] = [{'student': str(pk), 'grade': self.rng.randint(50, 100)}
+                            for pk in Student.objects(enrollments__course=course).scalar('id')]
+        return fixtures
+
+    def with_enrollment(self, fixtures):
+        from enrollments.models import Student
+
+        student = Student.objects(id=fixtures['student']).as_pymongo().first()
+        while not student.get('enrollments'):
+            fixtures['student'] = self.rng.choice(self.student_ids)
+            student = Student.objects(id=fixtures['student']).as_pymongo().first()
+        fixtures['enrolled_course'] = str(self.rng.choice(student['enrollments'])['course'])
+        return fixtures
+
+    def with_scratch_student(self, fixtures):
+        from enrollments.models import Student
+
+        student = Student(name='Scratch Student', city='Haifa', email=SCRATCH_EMAIL % self.next(),
+                          year_of_birth=1990).save()
+        fixtures['scratch_student'] = str(student.pk)
+        return fixtures
+
+    def course_data(self, fixtures):
+        return {'faculty': SCRATCH_FACULTY, 'subject': 'Created %d' % fixtures['sequence'],
+                'description': 'Benchmark', 'year': 2017, 'semester': '2', 'points': 4}
+
+    def student_data(self, fixtures, index=0):
+        return {'name': 'Created Student', 'city': 'Haifa', 'year_of_birth': 1990,
+                'email': SCRATCH_EMAIL % ('%d-%d' % (fixtures['sequence'], index)), 'enrollments': []}
+
+    def cleanup(self):
+        '''
+        Remove the scratch courses and students created by the run.
+        '''
+        from enrollments.models import Course, Student
+
+        for course in Course.objects(faculty=SCRATCH_FACULTY):
+            Student.objects.de_enrol(course)
+            course.delete()
+        Student.objects(email__startswith='bench-').delete()
+
+
+def endpoints(fixtures):
+    students = '/api/students/'
+    courses = '/api/courses/'
+    return [
+        Endpoint('courses.list', 'GET', courses),
+        Endpoint('courses.retrieve', 'GET', courses + '{course}/'),
+        Endpoint('courses.create', 'POST', courses, data=fixtures.course_data),
+        Endpoint('courses.update', 'PATCH', courses + '{course}/', data={'description': 'Updated {sequence}'}),
+        Endpoint('courses.destroy', 'DELETE', courses + '{scratch_course}/',
+                 prepare=fixtures.with_enrolled_scratch_course),
+        Endpoint('courses.export', 'GET', courses + 'export/?minimal_points=6'),
+        Endpoint('courses.bulk_create', 'POST', courses + 'bulk/',
+                 data=lambda f: [dict(fixtures.course_data(f), subject='Bulk %d-%d' % (f['sequence'], i))
+                                 for i in range(100)]),
+        Endpoint('courses.grades', 'POST', courses + '{scratch_course}/grades/', data=lambda f: f['rows'],
+                 prepare=fixtures.with_enrolled_scratch_course),
+        Endpoint('students.list', 'GET', students),
+        Endpoint('students.list_sparse', 'GET', students + '?fields=id,name,email'),
+        Endpoint('students.list_by_average', 'GET', students + '?ordering=-weighted_average'),
+        Endpoint('students.name_prefix', 'GET', students + '?name_prefix={name_prefix}'),
+        Endpoint('students.retrieve', 'GET', students + '{student}/'),
+        Endpoint('students.create', 'POST', students, data=fixtures.student_data),
+        Endpoint('students.update', 'PATCH', students + '{student}/', data={'city': 'Haifa'}),
+        Endpoint('students.destroy', 'DELETE', students + '{scratch_student}/',
+                 prepare=fixtures.with_scratch_student),
+        Endpoint('students.outstanding', 'GET', students + 'outstanding/'),
+        Endpoint('students.valedictorian', 'GET', students + 'valedictorian/'),
+        Endpoint('students.bulk_enrol', 'POST', students + 'bulk_enrol/?course={scratch_course}'
+                                                           '&name_prefix={name_prefix}',
+                 prepare=fixtures.with_scratch_course),
+        Endpoint('students.enrolled', 'GET', students + 'enrolled/?course={course}'),
+        Endpoint('students.enrol', 'POST', students + '{student}/enrol/', data={'course': '{scratch_course}'},
+                 prepare=fixtures.with_scratch_course),
+        Endpoint('students.grade', 'POST', students + '{student}/grade/',
+                 data={'course': '{enrolled_course}', 'grade': 85}, prepare=fixtures.with_enrollment),
+        Endpoint('students.export', 'GET', students + 'export/?name_prefix={name_prefix}'),
+        Endpoint('students.bulk_create', 'POST', students + 'bulk/',
+                 data=lambda f: [fixtures.student_data(f, i) for i in range(100)]),
+    ]
+
+
+def _fill(value, fixtures):
+    if callable(value):
+        return value(fixtures)
+    if isinstance(value, dict):
+        return dict((key, _fill(item, fixtures)) for key, item in value.items())
+    if isinstance(value, str):
+        return value.format(**fixtures)
+    return value
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    # Nearest rank
+    return ordered[max(0, int(math.ceil(fraction * len(ordered))) - 1)]
+
+
+def measure(client, counter, fixtures, endpoint, iterations, warmup, warm_cache):
+    from enrollments.cache import response_cache
+
+    latencies = []
+    round_trips = []
+    errors = 0
+    for iteration in range(warmup + iterations):
+        context = fixtures.base()
+        if endpoint.prepare:
+            context = endpoint.prepare(context)
+        path = _fill(endpoint.path, context)
+        data = endpoint.data and json.dumps(_fill(endpoint.data, context))
+        if not warm_cache:
+            response_cache.backend.clear()
+
+        sent = counter.count
+        started = time.time()
+        response = client.generic(endpoint.method, path, data or '', content_type=endpoint.content_type)
+        if response.streaming:
+            b''.join(response.streaming_content)
+        elapsed = time.time() - started
+
+        if iteration < warmup:
+            continue
+        latencies.append(elapsed)
+        round_trips.append(counter.count - sent)
+        if response.status_code >= 400:
+            errors += 1
+
+    total = sum(latencies)
+    return OrderedDict([
+        ('requests', len(latencies)),
+        ('errors', errors),
+        ('p50_ms', percentile(latencies, 0.50) * 1000),
+        ('p95_ms', percentile(latencies, 0.95) * 1000),
+        ('p99_ms', percentile(latencies, 0.99) * 1000),
+        ('mean_ms', total / len(latencies) * 1000),
+        ('throughput_rps', len(latencies) / total if total else None),
+        ('round_trips_mean', float(sum(round_trips)) / len(round_trips)),
+        ('round_trips_max', max(round_trips)),
+    ])
+
+
+def _revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD']).decode('ascii').strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--db', default=DEFAULT_DB, help='Database generated by benchmarks.dataset.')
+    parser.add_argument('--iterations', type=int, default=50, help='Measured requests per endpoint.')
+    parser.add_argument('--warmup', type=int, default=3, help='Unmeasured requests per endpoint.')
+    parser.add_argument('--only', help='Regular expression selecting the endpoints to run.')
+    parser.add_argument('--warm-cache', action='store_true',
+                        help='Keep the response cache between requests instead of measuring misses.')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='Write the results as JSON to this file.')
+    args = parser.parse_args(argv)
+
+    counter = RoundTripCounter()
+    setup(args.db, event_listeners=[counter])
+    from django.test import Client
+    from enrollments.models import Course, Student
+
+    started = time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())
+    fixtures = Fixtures(random.Random(args.seed))
+    client = Client(SERVER_NAME='localhost')
+    results = OrderedDict()
+    try:
+        for endpoint in endpoints(fixtures):
+            if args.only and not re.search(args.only, endpoint.name):
+                continue
+            results[endpoint.name] = measure(client, counter, fixtures, endpoint,
+                                             args.iterations, args.warmup, args.warm_cache)
+            stats = results[endpoint.name]
+            sys.stdout.write('%-28s p50 %8.2fms  p95 %8.2fms  p99 %8.2fms  %8.1f req/s  %5.1f round trips%s\n'
+                             % (endpoint.name, stats['p50_ms'], stats['p95_ms'], stats['p99_ms'],
+                                stats['throughput_rps'] or 0, stats['round_trips_mean'],
+                                '  %d errors' % stats['errors'] if stats['errors'] else ''))
+    finally:
+        fixtures.cleanup()
+
+    if args.output:
+        report = OrderedDict([
+            ('started', started),
+            ('revision', _revision()),
+            ('python', platform.python_version()),
+            ('dataset', {'db': args.db, 'courses': Course.objects.count(), 'students': Student.objects.count()}),
+            ('options', {'iterations': args.iterations, 'warmup': args.warmup, 'warm_cache': args.warm_cache,
+                         'seed': args.seed}),
+            ('endpoints', results),
+        ])
+        with open(args.output, 'w') as output:
+            json.dump(report, output, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -5,3 +5,10 @@ from django.apps import AppConfig
 
 class EnrollmentsConfig(AppConfig):
     name = 'enrollments'
+
+    def ready(self):
+        from enrollments.cache import connect_signals, course_cache
+        from enrollments.models import Course, Student
+
+        connect_signals(Course, Student)
+        course_cache.connect()
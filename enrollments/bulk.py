@@ -0,0 +1,98 @@
+from django.conf import settings
+from mongoengine.errors import ValidationError as DocumentValidationError
+from pymongo.errors import BulkWriteError
+from rest_framework import status
+from rest_framework.decorators import list_route
+from rest_framework.exceptions import ValidationError
+from rest_framework.parsers import JSONParser
+from rest_framework.permissions import AllowAny
+from rest_framework.response import Response
+from rest_framework_mongoengine.validators import UniqueValidator
+
+from enrollments.parsers import NDJSONParser
+from enrollments.signals import bulk_update
+
+
+class BulkCreateMixin(object):
+    '''
+    Adds a bulk create list route writing many documents with unordered insert_many batches.
+    '''
+
+    def prepare_bulk_documents(self, documents):
+        '''
+        Hook to complete a batch of validated, not yet saved documents before they are inserted.
+        '''
+        return documents
+
+    def bulk_documents_inserted(self, documents):
+        '''
+        Hook called with the documents of a batch that were inserted.
+        '''
+
+    @list_route(methods=['post'], permission_classes=[AllowAny], parser_classes=[JSONParser, NDJSONParser],
+                url_path='bulk')
+    def bulk_create(self, request):
+        '''
+        Create many documents from a JSON array, or from an NDJSON body with one document per line.
+
+        Every item is validated and inserted separately, so invalid items and duplicates
+        are reported with their index without aborting the rest of the batch.
+        '''
+        items = request.data
+        if not isinstance(items, list):
+            return Response(data={'error': 'Expected a list of items', 'details': ''},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        serializer = self.get_serializer(data=items, many=True).child
+        serializer._saving_instances = False
+        # Uniqueness is enforced by the unique indexes on insert instead of a query per item
+        for field in serializer.fields.values():
+            field.validators = [validator for validator in field.validators
+                                if not isinstance(validator, UniqueValidator)]
+
+        results = [None] * len(items)
+        documents = []
+        for index, item in enumerate(items):
+            try:
+                documents.append((index, serializer.recursive_save(serializer.run_validation(item))))
+            except ValidationError as e:
+                results[index] = {'index': index, 'errors': e.detail}
+
+        batch_size = getattr(settings, 'BULK_CREATE_BATCH_SIZE', 1000)
+        for start in range(0, len(documents), batch_size):
+            self._insert_batch(documents[start:start + batch_size], results)
+
+        if any(result and 'errors' in result for result in results):
+            return Response(results, status=status.HTTP_207_MULTI_STATUS)
+        return Response(results, status=status.HTTP_201_CREATED)
+
+    def _insert_batch(self, batch, results):
+        model = self.get_serializer_class().Meta.model
+        self.prepare_bulk_documents([document for _, document in batch])
+
+        to_insert = []
+        for index, document in batch:
+            try:
+                document.validate()
+            except DocumentValidationError as e:
+                results[index] = {'index': index, 'errors': e.to_dict()}
+                continue
+            to_insert.append((index, document, document.to_mongo()))
+        if not to_insert:
+            return
+
+        failed = {}
+        try:
+            model._get_collection().insert_many([son for _, _, son in to_insert], ordered=False)
+        except BulkWriteError as e:
+            failed = dict((error['index'], error['errmsg']) for error in e.details['writeErrors'])
+
+        inserted = []
+        for position, (index, document, son) in enumerate(to_insert):
+            if position in failed:
+                results[index] = {'index': index, 'errors': {'non_field_errors': [failed[position]]}}
+            else:
+                results[index] = {'index': index, 'id': str(son['_id'])}
+                inserted.append(document)
+        self.bulk_documents_inserted(inserted)
+        bulk_update.send(model)
@@ -0,0 +1,286 @@
+import hashlib
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.module_loading import import_string
+from mongoengine import signals
+
+from enrollments.models import Course
+from enrollments.signals import bulk_update
+
+
+class LocMemLRUCache(object):
+    '''
+    Process-local cache evicting the least recently used entry beyond max_entries,
+    and entries set with a timeout once it has passed.
+    '''
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            try:
+                value, expires = self._entries.pop(key)
+            except KeyError:
+                return None
+            if expires is not None and expires <= time.time():
+                return None
+            self._entries[key] = (value, expires)
+            return value
+
+    def set(self, key, value, timeout=None):
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (value, time.time() + timeout if timeout is not None else None)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class ResponseCache(object):
+    '''
+    Rendered GET responses, keyed on the request and on generation tokens of the data they were built from.
+
+    Every collection has a token for its list responses and one for all of its responses,
+    and every document has a token for its detail response. Invalidating rotates tokens,
+    so stale entries are never looked up again and simply age out of the backend.
+    Tokens remember when they were rotated, see settled.
+
+    Tokens are kept in the tokens cache, the backend by default. Unless it is shared by all processes,
+    writes of other processes are only seen once responses expire, after timeout seconds.
+    '''
+
+    def __init__(self, backend, tokens=None, timeout=None):
+        self.backend = backend
+        self.tokens = tokens if tokens is not None else backend
+        self.timeout = timeout
+
+    def _token(self, name):
+        # (token, rotation time)
+        key = 'token:%s' % name
+        token = self.tokens.get(key)
+        if token is None:
+            token = self._rotate(name, rotated_at=0)
+        return token
+
+    def _rotate(self, name, rotated_at=None):
+        token = (uuid.uuid4().hex, time.time() if rotated_at is None else rotated_at)
+        # Tokens never expire, a token replaced by a new one would make its responses look settled
+        self.tokens.set('token:%s' % name, token, None)
+        return token
+
+    def _tokens(self, namespace, object_id):
+        if object_id is None:
+            return [self._token(namespace), self._token('%s:list' % namespace)]
+        return [self._token(namespace), self._token('%s:%s' % (namespace, object_id))]
+
+    def key(self, namespace, object_id, request):
+        tokens = [token for token, _ in self._tokens(namespace, object_id)]
+        parts = tokens + [request.get_full_path(), request.META.get('HTTP_ACCEPT', '')]
+        return 'response:%s' % hashlib.md5('\n'.join(parts).encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        return self.backend.get(key)
+
+    def set(self, key, response):
+        self.backend.set(key, response, self.timeout)
+
+    def settled(self, namespace, object_id, seconds):
+        '''
+        Whether the data behind the responses of object_id, or of the namespace lists,
+        has not been invalidated in the last seconds.
+        '''
+        return all(time.time() - rotated_at >= seconds for _, rotated_at in self._tokens(namespace, object_id))
+
+    def invalidate(self, namespace, object_id=None):
+        '''
+        Invalidate the list responses and the detail response of object_id,
+        or every response of the namespace when no object_id is given.
+        '''
+        if object_id is None:
+            self._rotate(namespace)
+        else:
+            self._rotate('%s:list' % namespace)
+            self._rotate('%s:%s' % (namespace, object_id))
+
+
+class DocumentCache(object):
+    '''
+    Process-local read-through cache of the documents of a collection by primary key, for small,
+    rarely changing collections. Entries expire after ttl seconds, and are evicted beyond max_entries.
+
+    Cached documents are shared: read them, but load documents to update from the database.
+    Writes in this process invalidate entries through the document signals, see connect,
+    the ttl bounds how long writes of other processes may go unseen.
+    '''
+
+    def __init__(self, document, max_entries=1024, ttl=60):
+        self.document = document
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = LocMemLRUCache(max_entries)
+        self._lock = threading.Lock()
+        # Bumped by every invalidation, loads that raced with one aren't cached
+        self._generation = 0
+
+    def _key(self, pk):
+        return self.document._fields[self.document._meta['id_field']].to_python(pk)
+
+    def get(self, pk):
+        '''
+        The document with primary key pk, raises DoesNotExist like objects.get.
+        '''
+        key = self._key(pk)
+        document = self.get_many([key]).get(key)
+        if document is None:
+            raise self.document.DoesNotExist('%s matching id %s does not exist' % (self.document.__name__, pk))
+        return document
+
+    def get_many(self, pks):
+        '''
+        The documents with primary keys pks, loading the missing and expired ones with a single $in query.
+
+        Returns {pk: document}, without the pks of documents that don't exist.
+        '''
+        now = time.time()
+        found = {}
+        missing = []
+        for key in set(self._key(pk) for pk in pks):
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] > now:
+                found[key] = entry[0]
+            else:
+                missing.append(key)
+        with self._lock:
+            self.hits += len(found)
+            self.misses += len(missing)
+            generation = self._generation
+
+        if missing:
+            loaded = self.document.objects.in_bulk(missing)
+            with self._lock:
+                if generation == self._generation:
+                    for key, document in loaded.items():
+                        self._entries.set(key, (document, now + self.ttl))
+            found.update(loaded)
+        return found
+
+    def invalidate(self, pk=None):
+        '''
+        Drop the document with primary key pk, or every document.
+        '''
+        with self._lock:
+            self._generation += 1
+            if pk is None:
+                self._entries.clear()
+            else:
+                self._entries.delete(self._key(pk))
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses}
+
+    def _document_changed(self, sender, document, **kwargs):
+        self.invalidate(document.pk)
+
+    def _documents_changed(self, sender, **kwargs):
+        self.invalidate()
+
+    def connect(self):
+        signals.post_save.connect(self._document_changed, sender=self.document)
+        signals.post_delete.connect(self._document_changed, sender=self.document)
+        bulk_update.connect(self._documents_changed, sender=self.document)
+
+
+def _create_response_cache():
+    config = getattr(settings, 'RESPONSE_CACHE', {})
+    backend_class = import_string(config.get('BACKEND', 'enrollments.cache.LocMemLRUCache'))
+    tokens = caches[config['TOKENS']] if config.get('TOKENS') else None
+    return ResponseCache(backend_class(**config.get('OPTIONS', {})), tokens, config.get('TIMEOUT'))
+
+
+response_cache = _create_response_cache()
+
+course_cache = DocumentCache(Course, getattr(settings, 'COURSE_CACHE_SIZE', 1024),
+                             getattr(settings, 'COURSE_CACHE_TTL', 60))
+
+
+def document_changed(sender, document, **kwargs):
+    response_cache.invalidate(sender._get_collection_name(), document.pk)
+
+
+def documents_changed(sender, **kwargs):
+    response_cache.invalidate(sender._get_collection_name())
+
+
+def connect_signals(*documents):
+    for document in documents:
+        signals.post_save.connect(document_changed, sender=document)
+        signals.post_delete.connect(document_changed, sender=document)
+        bulk_update.connect(documents_changed, sender=document)
+
+
+def etag_for(content):
+    return '"%s"' % hashlib.md5(content).hexdigest()
+
+
+class CachedResponseMixin(object):
+    '''
+    Serve the GET actions listed in cached_actions from the response cache,
+    with strong ETags so clients can revalidate with If-None-Match.
+
+    Responses are invalidated by the writes of the view's collection only, see response_is_cached
+    for actions that also depend on other collections.
+    '''
+    cached_actions = ()
+
+    def response_is_cached(self, request, action):
+        return request.method == 'GET' and action in self.cached_actions
+
+    def dispatch(self, request, *args, **kwargs):
+        action = self.action_map.get(request.method.lower())
+        if not self.response_is_cached(request, action):
+            return super(CachedResponseMixin, self).dispatch(request, *args, **kwargs)
+
+        namespace = self.get_serializer_class().Meta.model._get_collection_name()
+        object_id = kwargs.get(self.lookup_url_kwarg or self.lookup_field)
+        # The key carries the tokens read before the view runs, so a write racing with
+        # this request leaves the response under tokens that are already rotated.
+        key = response_cache.key(namespace, object_id, request)
+        cached = response_cache.get(key)
+        if cached is None:
+            response = super(CachedResponseMixin, self).dispatch(request, *args, **kwargs)
+            if response.status_code != 200 or response.streaming:
+                return response
+            response.render()
+            cached = (response.content, list(response.items()), etag_for(response.content))
+            # Reads from a secondary may miss writes of the last few seconds, don't keep them past those writes
+            staleness = self.read_staleness() if hasattr(self, 'read_staleness') else 0
+            if not staleness or response_cache.settled(namespace, object_id, staleness):
+                response_cache.set(key, cached)
+
+        content, headers, etag = cached
+        if etag in [tag.strip() for tag in request.META.get('HTTP_IF_NONE_MATCH', '').split(',')]:
+            response = HttpResponseNotModified()
+        else:
+            response = HttpResponse(content)
+            for header, value in headers:
+                response[header] = value
+        response['ETag'] = etag
+        return response
@@ -0,0 +1,29 @@
+import json
+
+from django.conf import settings
+from django.http import StreamingHttpResponse
+from rest_framework.decorators import list_route
+from rest_framework.permissions import AllowAny
+from rest_framework.utils.encoders import JSONEncoder
+
+
+class ExportMixin(object):
+    '''
+    Adds an export list route streaming the filtered queryset as NDJSON, one document per line.
+    '''
+
+    @list_route(permission_classes=[AllowAny])
+    def export(self, request):
+        '''
+        Stream all documents as newline delimited JSON, filtering applies.
+        '''
+        batch_size = getattr(settings, 'EXPORT_BATCH_SIZE', 1000)
+        queryset = self.filter_queryset(self.get_queryset()).no_cache().batch_size(batch_size)
+        serializer = self.get_serializer()
+
+        def lines():
+            for document in queryset:
+                yield json.dumps(serializer.to_representation(document), cls=JSONEncoder,
+                                 ensure_ascii=False, separators=(',', ':')) + '\n'
+
+        return StreamingHttpResponse(lines(), content_type='application/x-ndjson')
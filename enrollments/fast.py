@@ -0,0 +1,118 @@
+from collections import OrderedDict
+
+import six
+from bson import DBRef
+from django.utils.encoding import smart_text
+from rest_framework import fields as drf_fields
+from rest_framework.response import Response
+from rest_framework.serializers import Serializer
+from rest_framework_mongoengine import fields as drfm_fields
+from rest_framework_mongoengine.generics import get_object_or_404
+
+_MISSING = object()
+
+
+def _inherits(field, base):
+    # The field is a base, or a subclass representing values the same way
+    return isinstance(field, base) and (six.get_unbound_function(type(field).to_representation) is
+                                        six.get_unbound_function(base.to_representation))
+
+
+def _reference_id(value):
+    return smart_text(value.id if isinstance(value, DBRef) else value)
+
+
+def _converter(field, model_field):
+    '''
+    A function turning a raw mongo value into the representation of field, or None if not supported.
+    '''
+    if isinstance(field, Serializer):
+        return compile_plan(field, model_field.document_type)
+    if _inherits(field, drf_fields.ListField):
+        convert = _converter(field.child, model_field.field)
+        if convert is None:
+            return None
+        return lambda values: [convert(value) if value is not None else None for value in values]
+    if _inherits(field, drfm_fields.ObjectIdField):
+        return smart_text
+    if _inherits(field, drfm_fields.ReferenceField) and _inherits(field.pk_field, drfm_fields.ObjectIdField):
+        return _reference_id
+    if _inherits(field, drf_fields.CharField):
+        return six.text_type
+    if _inherits(field, drf_fields.IntegerField):
+        return int
+    if _inherits(field, drf_fields.FloatField):
+        return float
+    if isinstance(field, (drf_fields.ChoiceField, drf_fields.BooleanField)):
+        return field.to_representation
+    return None
+
+
+def compile_plan(serializer, document):
+    '''
+    Compile the readable fields of serializer into a function building the same representation
+    straight from a raw pymongo document, with the defaults of document's fields for missing keys.
+
+    Returns None if a field can't be compiled.
+    '''
+    steps = []
+    for field in serializer._readable_fields:
+        model_field = document._fields.get(field.source)
+        if model_field is None:
+            return None
+        convert = _converter(field, model_field)
+        if convert is None:
+            return None
+        steps.append((field.field_name, model_field.db_field, model_field.default, convert))
+
+    def to_representation(raw):
+        ret = OrderedDict()
+        for name, key, default, convert in steps:
+            value = raw.get(key, _MISSING)
+            if value is _MISSING:
+                value = default() if callable(default) else default
+            ret[name] = convert(value) if value is not None else None
+        return ret
+
+    return to_representation
+
+
+class FastReadMixin(object):
+    '''
+    Serves list and retrieve from raw pymongo documents, converted by a plan compiled from the serializer,
+    skipping both mongoengine documents and the serializer fields. The output is the same as the
+    serializer's, pass ?fast=0 to get it from the serializer instead.
+    '''
+    fast_query_param = 'fast'
+    _plans = {}
+
+    def get_fast_plan(self):
+        if self.request.query_params.get(self.fast_query_param) == '0':
+            return None
+        serializer = self.get_serializer()
+        key = (type(serializer), tuple(serializer.fields))
+        if key not in self._plans:
+            self._plans[key] = compile_plan(serializer, serializer.Meta.model)
+        return self._plans[key]
+
+    def list(self, request, *args, **kwargs):
+        plan = self.get_fast_plan()
+        if plan is None:
+            return super(FastReadMixin, self).list(request, *args, **kwargs)
+
+        queryset = self.filter_queryset(self.get_queryset()).as_pymongo()
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response([plan(raw) for raw in page])
+        return Response([plan(raw) for raw in queryset])
+
+    def retrieve(self, request, *args, **kwargs):
+        plan = self.get_fast_plan()
+        if plan is None:
+            return super(FastReadMixin, self).retrieve(request, *args, **kwargs)
+
+        queryset = self.filter_queryset(self.get_queryset()).as_pymongo()
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        raw = get_object_or_404(queryset, **{self.lookup_field: self.kwargs[lookup_url_kwarg]})
+        self.check_object_permissions(request, raw)
+        return Response(plan(raw))
@@ -0,0 +1,167 @@
+import logging
+import threading
+from collections import deque
+from contextlib import contextmanager
+
+import six
+from django.conf import settings
+from django.http import Http404, JsonResponse
+from pymongo import monitoring
+
+logger = logging.getLogger(__name__)
+
+# Commands sent by the driver and mongoengine on their own, not counted against query budgets
+MAINTENANCE_COMMANDS = ('createIndexes', 'listIndexes', 'ismaster', 'isMaster', 'buildinfo', 'ping', 'endSessions')
+
+
+def _collection(event):
+    if event.command_name == 'getMore':
+        return event.command.get('collection')
+    target = event.command.get(event.command_name)
+    return target if isinstance(target, six.string_types) else None
+
+
+def _documents(reply):
+    cursor = reply.get('cursor')
+    if cursor is not None:
+        return len(cursor.get('firstBatch', cursor.get('nextBatch', ())))
+    if 'value' in reply:
+        return 1 if reply['value'] is not None else 0
+    return reply.get('n')
+
+
+class CommandRecorder(monitoring.CommandListener):
+    '''
+    Records the MongoDB commands sent by the current thread while inside record().
+    '''
+
+    def __init__(self):
+        self._local = threading.local()
+
+    @contextmanager
+    def record(self):
+        '''
+        Yields a list filling up with one dict per command: its name, database, collection, projection of finds,
+        duration in milliseconds and number of documents returned or affected.
+        '''
+        previous = getattr(self._local, 'commands', None), getattr(self._local, 'pending', None)
+        self._local.commands = commands = []
+        self._local.pending = {}
+        try:
+            yield commands
+        finally:
+            self._local.commands, self._local.pending = previous
+
+    def started(self, event):
+        commands = getattr(self._local, 'commands', None)
+        if commands is None:
+            return
+        command = {'command': event.command_name,
+                   'database': event.database_name,
+                   'collection': _collection(event),
+                   'projection': event.command.get('projection'),
+                   'duration_ms': None,
+                   'documents': None}
+        commands.append(command)
+        self._local.pending[event.request_id] = command
+
+    def succeeded(self, event):
+        command = self._finish(event)
+        if command is not None:
+            command['documents'] = _documents(event.reply)
+
+    def failed(self, event):
+        command = self._finish(event)
+        if command is not None:
+            command['failure'] = event.failure.get('errmsg', str(event.failure))
+
+    def _finish(self, event):
+        pending = getattr(self._local, 'pending', None)
+        command = pending.pop(event.request_id, None) if pending is not None else None
+        if command is not None:
+            command['duration_ms'] = event.duration_micros / 1000.0
+        return command
+
+
+# Passed to the mongo client in the settings, so it sees every command of the process
+command_recorder = CommandRecorder()
+
+_recent_requests = None
+_recent_requests_lock = threading.Lock()
+
+
+def _debug_panel_requests():
+    global _recent_requests
+    with _recent_requests_lock:
+        if _recent_requests is None:
+            _recent_requests = deque(maxlen=getattr(settings, 'MONGO_DEBUG_PANEL_SIZE', 50))
+        return _recent_requests
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+def query_budget(view_func, request):
+    '''
+    Round trip budget of the viewset action handling request, from the viewset's query_budgets.
+    '''
+    viewset = getattr(view_func, 'cls', None)
+    actions = getattr(view_func, 'actions', None) or {}
+    action = actions.get(request.method.lower())
+    return getattr(viewset, 'query_budgets', {}).get(action)
+
+
+class MongoInstrumentationMiddleware(object):
+    '''
+    Records the MongoDB commands of every request and reports their count and total duration
+    in the X-Mongo-Queries and Server-Timing headers.
+
+    Viewsets can set query_budgets, mapping actions to the most round trips they may take.
+    Exceeding a budget is logged, or raises QueryBudgetExceeded when MONGO_QUERY_BUDGET_ACTION is 'raise'.
+    Commands sent while a streaming response is consumed happen after this middleware and are not recorded.
+    '''
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with command_recorder.record() as commands:
+            response = self.get_response(request)
+
+        duration = sum(command['duration_ms'] or 0 for command in commands)
+        response['X-Mongo-Queries'] = str(len(commands))
+        timing = 'mongo;dur=%.3f;desc="%d queries"' % (duration, len(commands))
+        response['Server-Timing'] = ', '.join(filter(None, [response.get('Server-Timing'), timing]))
+
+        if getattr(settings, 'MONGO_DEBUG_PANEL', False):
+            _debug_panel_requests().appendleft({'method': request.method,
+                                                'path': request.get_full_path(),
+                                                'status': response.status_code,
+                                                'queries': len(commands),
+                                                'duration_ms': duration,
+                                                'commands': commands})
+
+        budget = getattr(request, 'mongo_query_budget', None)
+        if budget is not None:
+            response['X-Mongo-Query-Budget'] = str(budget)
+            round_trips = len([command for command in commands if command['command'] not in MAINTENANCE_COMMANDS])
+            if round_trips > budget:
+                message = 'Query budget exceeded by %s %s: %d round trips, budget is %d' % (
+                    request.method, request.path, round_trips, budget)
+                if getattr(settings, 'MONGO_QUERY_BUDGET_ACTION', 'log') == 'raise':
+                    raise QueryBudgetExceeded(message)
+                logger.warning(message)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.mongo_query_budget = query_budget(view_func, request)
+
+
+def mongo_debug_panel(request):
+    '''
+    The MongoDB commands of the latest requests as JSON, newest first, when MONGO_DEBUG_PANEL is on.
+    '''
+    if not getattr(settings, 'MONGO_DEBUG_PANEL', False):
+        raise Http404
+    return JsonResponse({'requests': list(_debug_panel_requests())})
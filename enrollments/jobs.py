@@ -0,0 +1,188 @@
+import datetime
+import logging
+import os
+import socket
+import threading
+import uuid
+
+from bson import json_util
+from django.conf import settings
+from six.moves import queue
+
+from enrollments.models import JOB_DONE, JOB_FAILED, JOB_PENDING, JOB_RUNNING, Course, Job, Student
+
+logger = logging.getLogger(__name__)
+
+
+def _now():
+    return datetime.datetime.utcnow()
+
+
+def job_students(job):
+    return Student.objects(__raw__=json_util.loads(job.query or '{}'))
+
+
+def bulk_enrol_step(job, chunk_size):
+    course = Course.objects.get(id=job.params['course'])
+    students = job_students(job)
+    if job.last_id is not None:
+        students = students.filter(id__gt=job.last_id)
+    student_ids = list(students.order_by('id').limit(chunk_size).scalar('id'))
+    if not student_ids:
+        return None
+    result = Student.objects(id__in=student_ids).enrol(course)
+    return student_ids[-1], len(student_ids), result.modified_count
+
+
+def destroy_course_step(job, chunk_size):
+    course = Course.objects(id=job.params['course']).first()
+    if course is None:
+        return None
+    # De-enrolled students no longer match, so every chunk starts over
+    student_ids = list(Student.objects(enrollments__course=course).order_by('id').limit(chunk_size).scalar('id'))
+    if not student_ids:
+        return None
+    return student_ids[-1], len(student_ids), Student.objects(id__in=student_ids).de_enrol(course)
+
+
+def destroy_course_finish(job):
+    course = Course.objects(id=job.params['course']).first()
+    if course is not None:
+        course.delete()
+
+
+# Job kinds: a step doing the next chunk of a job and returning (last id, processed, modified),
+# or None once there is nothing left, and an optional function finishing the job
+JOB_KINDS = {
+    'bulk_enrol': (bulk_enrol_step, None),
+    'destroy_course': (destroy_course_step, destroy_course_finish),
+}
+
+
+class JobRunner(object):
+    '''
+    Runs jobs on a bounded pool of threads of this process.
+
+    Jobs are claimed atomically from the jobs collection and checkpointed after every chunk. A job whose runner
+    stopped is claimed again by any runner once its heartbeat is older than stale_seconds, and resumes
+    after its last checkpoint, so chunks must be safe to run twice.
+    '''
+
+    def __init__(self, workers=2, chunk_size=1000, poll_interval=5.0, stale_seconds=60):
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self.poll_interval = poll_interval
+        self.stale_seconds = stale_seconds
+        self.owner = None
+        self._pid = None
+        self._queue = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        '''
+        Start the worker threads, once per process: threads don't survive a fork.
+        '''
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self.owner = '%s:%d:%s' % (socket.gethostname(), os.getpid(), uuid.uuid4().hex[:8])
+            self._queue = queue.Queue()
+            for number in range(self.workers):
+                thread = threading.Thread(target=self._work, name='job-runner-%d' % number)
+                thread.daemon = True
+                thread.start()
+            self._pid = os.getpid()
+
+    def submit(self, kind, params, students=None, total=None):
+        '''
+        Save a job of kind and wake a worker thread to run it. students is the queryset of the students it runs over.
+
+        Returns the pending job.
+        '''
+        query = json_util.dumps(students._query) if students is not None else None
+        job = Job(kind=kind, params=params, query=query, total=total).save()
+        self.start()
+        self._queue.put(job.id)
+        return job
+
+    def claim(self, job_id=None):
+        '''
+        Claim job_id, or the oldest claimable job, if it is pending or its runner stopped.
+
+        Returns the claimed job, or None.
+        '''
+        stale = _now() - datetime.timedelta(seconds=self.stale_seconds)
+        jobs = Job.objects(__raw__={'$or': [{'status': JOB_PENDING},
+                                            {'status': JOB_RUNNING, 'heartbeat_at': {'$lt': stale}}]})
+        if job_id is not None:
+            jobs = jobs.filter(id=job_id)
+        return jobs.order_by('created_at').modify(set__status=JOB_RUNNING, set__owner=self.owner,
+                                                  set__started_at=_now(), set__heartbeat_at=_now(),
+                                                  inc__attempts=1, new=True)
+
+    def run(self, job):
+        step, finish = JOB_KINDS[job.kind]
+        try:
+            while True:
+                progress = step(job, self.chunk_size)
+                if progress is None:
+                    break
+                last_id, processed, modified = progress
+                if not self._checkpoint(job, set__last_id=last_id, inc__processed=processed,
+                                        inc__modified=modified):
+                    logger.warning('Job %s was claimed by another runner', job.id)
+                    return
+                job.last_id = last_id
+            if finish is not None:
+                finish(job)
+            self._checkpoint(job, set__status=JOB_DONE, set__finished_at=_now())
+        except Exception as e:
+            logger.exception('Job %s failed', job.id)
+            self._checkpoint(job, set__status=JOB_FAILED, set__finished_at=_now(),
+                             push__errors='%s: %s' % (type(e).__name__, e))
+
+    def _checkpoint(self, job, **update):
+        # Only written while the job is still ours
+        return Job.objects(id=job.id, owner=self.owner, status=JOB_RUNNING).update_one(
+            set__heartbeat_at=_now(), **update)
+
+    def _work(self):
+        while True:
+            try:
+                job_id = self._queue.get(timeout=self.poll_interval)
+            except queue.Empty:
+                job_id = None
+            try:
+                job = self.claim(job_id)
+                while job is not None:
+                    self.run(job)
+                    job = self.claim()
+            except Exception:
+                logger.exception('Job runner failed to claim a job')
+
+
+def _create_runner():
+    return JobRunner(getattr(settings, 'JOB_WORKERS', 2),
+                     getattr(settings, 'JOB_CHUNK_SIZE', 1000),
+                     getattr(settings, 'JOB_POLL_INTERVAL', 5.0),
+                     getattr(settings, 'JOB_STALE_SECONDS', 60))
+
+
+runner = _create_runner()
+
+
+class JobRunnerMiddleware(object):
+    '''
+    Starts the job runner of the process on its first request, so that the jobs of stopped workers are resumed
+    without waiting for a new job to be submitted. Not at import: preforking servers load the application
+    in a parent whose threads and connections the workers don't inherit.
+    '''
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        runner.start()
+        return self.get_response(request)
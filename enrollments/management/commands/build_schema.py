@@ -0,0 +1,21 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from unirest.schema import build_schema
+
+
+class Command(BaseCommand):
+    help = 'Generate the OpenAPI schema served at /docs/ into a file, API_SCHEMA_PATH by default.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', default=None, help='File to write the schema to.')
+
+    def handle(self, *args, **options):
+        path = options['output'] or getattr(settings, 'API_SCHEMA_PATH', None)
+        if not path:
+            self.stderr.write('Pass --output or set API_SCHEMA_PATH')
+            return
+        schema = build_schema()
+        with open(path, 'wb') as output:
+            output.write(schema)
+        self.stdout.write('Wrote the API schema to %s (%d bytes)' % (path, len(schema)))
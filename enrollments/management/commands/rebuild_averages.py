@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from enrollments.models import Student
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the denormalized weighted grade average fields of all students.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Number of students rebuilt per round trip.')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        rebuilt = 0
+        batch = []
+        for student_id in Student.objects.scalar('id').no_cache():
+            batch.append(student_id)
+            if len(batch) >= batch_size:
+                rebuilt += Student.objects(id__in=batch).rebuild_averages()
+                batch = []
+        if batch:
+            rebuilt += Student.objects(id__in=batch).rebuild_averages()
+        self.stdout.write('Rebuilt weighted averages of %d students' % rebuilt)
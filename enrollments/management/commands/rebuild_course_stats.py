@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from enrollments.models import Course, CourseStats
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the grade statistics of all courses from the student enrollments.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100,
+                            help='Number of courses rebuilt per aggregation.')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        rebuilt = 0
+        batch = []
+        for course_id in Course.objects.scalar('id').no_cache():
+            batch.append(course_id)
+            if len(batch) >= batch_size:
+                rebuilt += len(CourseStats.objects.rebuild(batch))
+                batch = []
+        if batch:
+            rebuilt += len(CourseStats.objects.rebuild(batch))
+        self.stdout.write('Rebuilt grade statistics of %d courses' % rebuilt)
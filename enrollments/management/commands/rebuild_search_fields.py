@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+from pymongo import UpdateOne
+
+from enrollments.models import Student
+from enrollments.signals import bulk_update
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the lowercased name and city search fields of all students.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Number of students rewritten per round trip.')
+
+    def handle(self, *args, **options):
+        collection = Student._get_collection()
+        rebuilt = 0
+        operations = []
+        for student in Student.objects.only('name', 'city').as_pymongo().no_cache():
+            operations.append(UpdateOne({'_id': student['_id']},
+                                        {'$set': {'name_lower': student.get('name', '').lower(),
+                                                  'city_lower': student.get('city', '').lower()}}))
+            if len(operations) >= options['batch_size']:
+                rebuilt += collection.bulk_write(operations, ordered=False).modified_count
+                operations = []
+        if operations:
+            rebuilt += collection.bulk_write(operations, ordered=False).modified_count
+        bulk_update.send(Student)
+        self.stdout.write('Rebuilt search fields of %d students' % rebuilt)
@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from enrollments.jobs import runner
+
+
+class Command(BaseCommand):
+    help = 'Run background jobs, resuming those of stopped workers, until interrupted.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=None,
+                            help='Number of jobs run concurrently, JOB_WORKERS by default.')
+
+    def handle(self, *args, **options):
+        if options['workers']:
+            runner.workers = options['workers']
+        runner.start()
+        self.stdout.write('Running jobs as %s' % runner.owner)
+        try:
+            while True:
+                time.sleep(60)
+        except KeyboardInterrupt:
+            pass
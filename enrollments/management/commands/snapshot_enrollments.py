@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from enrollments.models import Course, Student
+
+
+class Command(BaseCommand):
+    help = 'Copy the course snapshot fields into the enrollments of all students.'
+
+    def handle(self, *args, **options):
+        updated = 0
+        for course in Course.objects.no_cache():
+            updated += Student.objects.update_course_snapshot(course)
+        self.stdout.write('Updated the course snapshots of %d enrollments' % updated)
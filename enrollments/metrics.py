@@ -0,0 +1,233 @@
+import bisect
+import glob
+import json
+import os
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.http import HttpResponse
+from mongoengine.connection import get_connection
+from pymongo import MongoClient
+
+from enrollments.cache import course_cache
+
+# Upper bounds of the histogram buckets, an implicit +Inf bucket follows
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (100, 1000, 10000, 100000, 1000000, 10000000)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _observe(series, key, buckets, value):
+    # Per bucket counts, not cumulative, followed by the sum of the observed values
+    histogram = series.get(key)
+    if histogram is None:
+        histogram = series[key] = [0] * (len(buckets) + 2)
+    histogram[bisect.bisect_left(buckets, value)] += 1
+    histogram[-1] += value
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except OSError:
+        return False
+    return True
+
+
+def pool_stats():
+    '''
+    Sockets of the mongo connection pools of this process, per server address.
+
+    pymongo has no pool monitoring API yet, so this reads its pools directly and returns nothing
+    for clients that don't have them, such as mongomock ones.
+    '''
+    stats = {}
+    client = get_connection()
+    if not isinstance(client, MongoClient):
+        return stats
+    try:
+        servers = client._topology._servers
+        for address, server in list(servers.items()):
+            pool = server.pool
+            stats['%s:%s' % address] = {'idle': len(pool.sockets),
+                                        'in_use': pool.active_sockets,
+                                        'max': pool.opts.max_pool_size or 0}
+    except AttributeError:
+        pass
+    return stats
+
+
+class MetricsRegistry(object):
+    '''
+    Request counters and histograms of this process, flushed to a file of its own in directory.
+
+    Collecting reads the files of every process, so the totals of all WSGI workers sharing
+    the directory are reported whichever worker serves the scrape.
+    '''
+
+    def __init__(self, directory, flush_interval=1.0):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self.pid = os.getpid()
+        # The start time keeps a restarted worker reusing a pid from overwriting the old totals
+        self.path = os.path.join(self.directory, '%d-%d.json' % (self.pid, time.time() * 1000))
+        self.requests = {}
+        self.latency = {}
+        self.size = {}
+        self._flushed_at = 0
+
+    def observe(self, route, method, status, seconds, size=None):
+        if os.getpid() != self.pid:
+            # Forked from the process that created the registry
+            with self._lock:
+                if os.getpid() != self.pid:
+                    self._reset()
+
+        key = (route, method)
+        with self._lock:
+            request_key = key + ('%dxx' % (status // 100),)
+            self.requests[request_key] = self.requests.get(request_key, 0) + 1
+            _observe(self.latency, key, LATENCY_BUCKETS, seconds)
+            if size is not None:
+                _observe(self.size, key, SIZE_BUCKETS, size)
+
+        if time.time() - self._flushed_at >= self.flush_interval:
+            self.flush()
+
+    def snapshot(self):
+        with self._lock:
+            return {'pid': self.pid,
+                    'requests': [[list(key), value] for key, value in self.requests.items()],
+                    'latency': [[list(key), list(value)] for key, value in self.latency.items()],
+                    'size': [[list(key), list(value)] for key, value in self.size.items()],
+                    'pools': pool_stats(),
+                    'course_cache': course_cache.stats()}
+
+    def flush(self):
+        self._flushed_at = time.time()
+        snapshot = self.snapshot()
+        if not os.path.isdir(self.directory):
+            try:
+                os.makedirs(self.directory)
+            except OSError:
+                if not os.path.isdir(self.directory):
+                    raise
+        # Written aside and renamed, so readers never see a partial file
+        temporary = '%s.%s.tmp' % (self.path, threading.current_thread().ident)
+        with open(temporary, 'w') as output:
+            json.dump(snapshot, output)
+        os.rename(temporary, self.path)
+
+    def collect(self):
+        '''
+        Sum the metrics of all processes. Pool gauges are only summed over processes still alive.
+        '''
+        self.flush()
+        requests, latency, size, pools, caches = {}, {}, {}, {}, {}
+        for path in glob.glob(os.path.join(self.directory, '*.json')):
+            try:
+                with open(path) as metrics_file:
+                    snapshot = json.load(metrics_file)
+            except (IOError, OSError, ValueError):
+                continue
+            for key, value in snapshot['requests']:
+                requests[tuple(key)] = requests.get(tuple(key), 0) + value
+            for series, totals in ((snapshot['latency'], latency), (snapshot['size'], size)):
+                for key, value in series:
+                    current = totals.get(tuple(key))
+                    totals[tuple(key)] = value if current is None else [a + b for a, b in zip(current, value)]
+            for name, value in snapshot.get('course_cache', {}).items():
+                caches[name] = caches.get(name, 0) + value
+            if snapshot['pid'] == self.pid or _pid_alive(snapshot['pid']):
+                for address, stats in snapshot['pools'].items():
+                    current = pools.setdefault(address, {})
+                    for name, value in stats.items():
+                        current[name] = current.get(name, 0) + value
+        return requests, latency, size, pools, caches
+
+
+def _labels(**labels):
+    return '{%s}' % ','.join('%s="%s"' % (name, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+                             for name, value in sorted(labels.items()))
+
+
+def _histogram_lines(name, buckets, series):
+    lines = []
+    for (route, method), histogram in sorted(series.items()):
+        cumulative = 0
+        for bound, count in zip(buckets + ('+Inf',), histogram[:-1]):
+            cumulative += count
+            lines.append('%s_bucket%s %d' % (name, _labels(route=route, method=method, le=bound), cumulative))
+        lines.append('%s_sum%s %s' % (name, _labels(route=route, method=method), repr(float(histogram[-1]))))
+        lines.append('%s_count%s %d' % (name, _labels(route=route, method=method), cumulative))
+    return lines
+
+
+def render(requests, latency, size, pools, caches):
+    lines = ['# HELP unirest_requests_total Requests served, by route, method and status class.',
+             '# TYPE unirest_requests_total counter']
+    for (route, method, status), count in sorted(requests.items()):
+        lines.append('unirest_requests_total%s %d' % (_labels(route=route, method=method, status=status), count))
+
+    lines += ['# HELP unirest_request_duration_seconds Request latency, by route and method.',
+              '# TYPE unirest_request_duration_seconds histogram']
+    lines += _histogram_lines('unirest_request_duration_seconds', LATENCY_BUCKETS, latency)
+    lines += ['# HELP unirest_response_size_bytes Response body size, by route and method.',
+              '# TYPE unirest_response_size_bytes histogram']
+    lines += _histogram_lines('unirest_response_size_bytes', SIZE_BUCKETS, size)
+
+    for name, description in (('idle', 'Idle pooled mongo connections.'),
+                              ('in_use', 'Mongo connections checked out of the pools.'),
+                              ('max', 'Mongo connection pool size limit, summed over processes.')):
+        lines += ['# HELP unirest_mongo_pool_%s %s' % (name, description),
+                  '# TYPE unirest_mongo_pool_%s gauge' % name]
+        for address, stats in sorted(pools.items()):
+            lines.append('unirest_mongo_pool_%s%s %d' % (name, _labels(address=address), stats.get(name, 0)))
+
+    for name, description in (('hits', 'Course lookups served from the process caches.'),
+                              ('misses', 'Course lookups loaded from the database.')):
+        lines += ['# HELP unirest_course_cache_%s_total %s' % (name, description),
+                  '# TYPE unirest_course_cache_%s_total counter' % name,
+                  'unirest_course_cache_%s_total %d' % (name, caches.get(name, 0))]
+    return '\n'.join(lines) + '\n'
+
+
+def _create_registry():
+    return MetricsRegistry(getattr(settings, 'METRICS_DIR', os.path.join(tempfile.gettempdir(), 'unirest-metrics')),
+                           getattr(settings, 'METRICS_FLUSH_INTERVAL', 1.0))
+
+
+registry = _create_registry()
+
+
+class MetricsMiddleware(object):
+    '''
+    Observes the latency, response size and status of every request, keyed by its route name.
+    '''
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        started = time.time()
+        response = self.get_response(request)
+        match = getattr(request, 'resolver_match', None)
+        route = match.url_name if match is not None and match.url_name else 'unmatched'
+        # The size of streaming responses is unknown until they are consumed
+        size = None if response.streaming else len(response.content)
+        registry.observe(route, request.method, response.status_code, time.time() - started, size)
+        return response
+
+
+def metrics(request):
+    '''
+    The metrics of all worker processes in the Prometheus text format.
+    '''
+    return HttpResponse(render(*registry.collect()), content_type=CONTENT_TYPE)
@@ -1,9 +1,31 @@
-from mongoengine import Document, EmbeddedDocument, fields
+import datetime
+
+from bson import DBRef
+from bson.son import SON
+from mongoengine import Document, EmbeddedDocument, QuerySet, fields, signals
+from pymongo import ReplaceOne, UpdateOne
+
+from enrollments.signals import bulk_update
 
 SEMESTERS = (('1', 'Fall'),
              ('2', 'Spring'),
              ('3', 'Summer'),)
 
+JOB_PENDING = 'pending'
+JOB_RUNNING = 'running'
+JOB_DONE = 'done'
+JOB_FAILED = 'failed'
+JOB_STATUSES = (JOB_PENDING, JOB_RUNNING, JOB_DONE, JOB_FAILED)
+
+
+class DocumentQuerySet(QuerySet):
+    def _get_as_pymongo(self, row):
+        # as_pymongo yields the documents as mongo returns them: the projection is already applied there,
+        # re-filtering it in python copies every document and drops the subfields of embedded lists
+        if self._as_pymongo_coerce:
+            return super(DocumentQuerySet, self)._get_as_pymongo(row)
+        return row
+
 
 class Course(Document):
     faculty = fields.StringField(required=True)
@@ -15,20 +37,300 @@ class Course(Document):
 
     points = fields.IntField(required=True, default=4)
 
+    meta = {
+        'queryset_class': DocumentQuerySet,
+    }
+
     def __repr__(self):
         return '<Course %s %s:%s>' % (self.subject, self.year, self.semester)
 
     def get_enrolled_students(self, students_queryset):
-        return filter(lambda student: self in student.enrolled_courses(),
-                      students_queryset)
+        return students_queryset.filter(enrollments__course=self).no_cache()
 
 
 class Enrollment(EmbeddedDocument):
     course = fields.ReferenceField(Course)
     grade = fields.IntField(null=True, blank=True)
 
+    # Snapshot of the course fields read with the enrollments, so reading them doesn't need the course.
+    # Copied on enrol, and into every enrollment to a course when the course is updated.
+    subject = fields.StringField()
+    semester = fields.StringField(max_length=1, choices=SEMESTERS)
+    points = fields.IntField()
+
+    snapshot_fields = ('subject', 'semester', 'points')
+
+    @classmethod
+    def snapshot(cls, course):
+        return dict((name, getattr(course, name)) for name in cls.snapshot_fields)
+
+    @classmethod
+    def for_course(cls, course, grade=None):
+        return cls(course=course, grade=grade, **cls.snapshot(course))
+
     def __repr__(self):
-        return '<Enrollment %s (%s)>' % (self.course.subject, self.grade)
+        return '<Enrollment %s (%s)>' % (self.subject, self.grade)
+
+
+def prefetch_courses(students):
+    '''
+    Resolve the course of every enrollment of students with a single $in query, instead of one query per
+    student when its enrollments are first read. Courses are read from the database and not the course cache,
+    they are copied into the enrollment snapshots written.
+
+    Returns students as a list.
+    '''
+    students = list(students)
+    # Read the raw list: the enrollments descriptor would dereference every student separately
+    enrollments = [enrollment for student in students for enrollment in student._data.get('enrollments') or []]
+    course_ids = set(enrollment._data['course'].id for enrollment in enrollments
+                     if isinstance(enrollment._data.get('course'), DBRef))
+    if course_ids:
+        courses = Course.objects.in_bulk(list(course_ids))
+        for enrollment in enrollments:
+            reference = enrollment._data.get('course')
+            if isinstance(reference, DBRef) and reference.id in courses:
+                enrollment._data['course'] = courses[reference.id]
+    return students
+
+
+def enrolled_course_ids(students):
+    '''
+    The ids of the courses students are enrolled to, read without dereferencing them.
+    '''
+    course_ids = set()
+    for student in students:
+        for enrollment in student._data.get('enrollments') or []:
+            course = enrollment._data.get('course')
+            if course is not None:
+                course_ids.add(course.id if isinstance(course, DBRef) else course.pk)
+    return course_ids
+
+
+def weighted_average(weighted_sum, total_points):
+    if total_points > 0:
+        return float(weighted_sum) / total_points
+    return 0.0
+
+
+def average_fields(weighted_sum, total_points):
+    return {'weighted_sum': weighted_sum,
+            'total_points': total_points,
+            'weighted_average': weighted_average(weighted_sum, total_points)}
+
+
+def parse_grade(grade):
+    if grade is None or grade == '':
+        return None
+    return int(grade)
+
+
+class StudentQuerySet(DocumentQuerySet):
+    def weighted_sums(self):
+        '''
+        Compute the points-weighted grade sums of every student in this queryset inside MongoDB.
+
+        The queryset filters become the leading $match stage. Ungraded enrollments are ignored.
+        Yields {'_id': student_id, 'weighted_sum': ..., 'total_points': ...} documents.
+        '''
+        return self.aggregate(
+            {'$unwind': '$enrollments'},
+            {'$match': {'enrollments.grade': {'$ne': None}}},
+            {'$group': {'_id': '$_id',
+                        'weighted_sum': {'$sum': {'$multiply': ['$enrollments.grade', '$enrollments.points']}},
+                        'total_points': {'$sum': '$enrollments.points'}}},
+        )
+
+    def rebuild_averages(self):
+        '''
+        Recompute the denormalized grade average fields of every student in this queryset.
+
+        Returns the number of students rewritten.
+        '''
+        sums = dict((row['_id'], row) for row in self.weighted_sums())
+        operations = []
+        for student_id in self.scalar('id'):
+            row = sums.get(student_id, {})
+            operations.append(UpdateOne({'_id': student_id},
+                                        {'$set': average_fields(row.get('weighted_sum', 0),
+                                                                row.get('total_points', 0))}))
+        if operations:
+            self._document._get_collection().bulk_write(operations, ordered=False)
+            bulk_update.send(self._document)
+        return len(operations)
+
+    def grades_in(self, course):
+        '''
+        Read the grade in course of every student in this queryset that is enrolled to it,
+        projecting only the matching enrollment of each student.
+
+        Returns {student_id: grade}.
+        '''
+        cursor = self._document._get_collection().find(
+            self.filter(enrollments__course=course)._query,
+            {'enrollments': {'$elemMatch': {'course': course.pk}}})
+        return dict((student['_id'], student['enrollments'][0].get('grade')) for student in cursor)
+
+    def set_grades(self, course, grades):
+        '''
+        Set the grades of many students in course with one unordered bulk_write of positional $set operations,
+        then rebuild the denormalized average fields of those students and the grade counts of course.
+
+        grades maps student ids to grades. The counts are recounted rather than moved by the previous grades,
+        which other grade writes may change between reading them and the bulk_write.
+        Returns the pymongo BulkWriteResult.
+        '''
+        operations = [UpdateOne({'_id': student_id, 'enrollments.course': course.pk},
+                                {'$set': {'enrollments.$.grade': grade}})
+                      for student_id, grade in grades.items()]
+        if not operations:
+            return None
+        result = self._document._get_collection().bulk_write(operations, ordered=False)
+        CourseStats.objects.rebuild([course.pk])
+        self.filter(id__in=list(grades)).rebuild_averages()
+        return result
+
+    def enrol(self, course):
+        '''
+        Enrol every student in this queryset to course with a single $push,
+        skipping students that are already enrolled to it.
+
+        Returns the pymongo UpdateResult.
+        '''
+        not_enrolled = self.filter(enrollments__course__ne=course)
+        result = self._document._get_collection().update_many(
+            not_enrolled._query, {'$push': {'enrollments': Enrollment.for_course(course).to_mongo()}})
+        CourseStats.objects.record_enrollments(course, result.modified_count)
+        bulk_update.send(self._document)
+        return result
+
+    def modify_enrol(self, course):
+        '''
+        Atomically enrol the first student of this queryset to course with a conditional $push,
+        which only matches while the student is not enrolled to it yet.
+
+        Returns the updated student, or None if no student matched.
+        '''
+        student = self.filter(enrollments__course__ne=course).modify(
+            push__enrollments=Enrollment.for_course(course), new=True)
+        if student is not None:
+            CourseStats.objects.record_enrollments(course)
+            signals.post_save.send(self._document, document=student, created=False)
+        return student
+
+    def modify_grade(self, course, grade):
+        '''
+        Atomically set the grade of the first student of this queryset in course with a positional $set.
+
+        The denormalized average fields are then moved by the grade difference with $inc,
+        and weighted_average is only written if no other update changed the sums in between.
+        Returns the updated student, or None if no student enrolled to course matched.
+        '''
+        grade = parse_grade(grade)
+        before = self.filter(enrollments__course=course).modify(set__enrollments__S__grade=grade)
+        if before is None:
+            return None
+
+        enrollment = [enrollment for enrollment in before._data['enrollments']
+                      if enrollment._data['course'].id == course.pk][0]
+        previous = enrollment.grade
+        CourseStats.objects.record_grades(course, [(previous, grade)])
+        # The points the averages were summed with, course may be a stale copy
+        points = enrollment.points if enrollment.points is not None else course.points
+        sum_delta = points_delta = 0
+        if previous is not None:
+            sum_delta -= previous * points
+            points_delta -= points
+        if grade is not None:
+            sum_delta += grade * points
+            points_delta += points
+
+        student = self._document.objects(id=before.id).modify(
+            inc__weighted_sum=sum_delta, inc__total_points=points_delta, new=True)
+        average = weighted_average(student.weighted_sum, student.total_points)
+        if average != student.weighted_average:
+            self._document.objects(id=student.id, weighted_sum=student.weighted_sum,
+                                   total_points=student.total_points).update_one(set__weighted_average=average)
+            student.weighted_average = average
+        signals.post_save.send(self._document, document=student, created=False)
+        return student
+
+    def update_course_snapshot(self, course):
+        '''
+        Copy the snapshot fields of course into the enrollments to it of every student in this queryset,
+        with a single positional update_many: students are enrolled to a course at most once.
+
+        Returns the number of students updated.
+        '''
+        snapshot = Enrollment.snapshot(course)
+        result = self._document._get_collection().update_many(
+            self.filter(enrollments__course=course)._query,
+            {'$set': dict(('enrollments.$.%s' % Enrollment._fields[name].db_field, value)
+                          for name, value in snapshot.items())})
+        bulk_update.send(self._document)
+        return result.modified_count
+
+    def de_enrol(self, course):
+        '''
+        Remove course from the enrollments of every student in this queryset with a single $pull.
+
+        Returns the number of students that were enrolled to it.
+        '''
+        enrolled = self.filter(enrollments__course=course)
+        graded = list(enrolled.filter(__raw__={'enrollments': {'$elemMatch': {'course': course.pk,
+                                                                              'grade': {'$ne': None}}}})
+                      .scalar('id'))
+        result = self._document._get_collection().update_many(
+            enrolled._query, {'$pull': {'enrollments': {'course': course.pk}}})
+        if graded:
+            self._document.objects(id__in=graded).rebuild_averages()
+        CourseStats.objects.invalidate([course.pk])
+        bulk_update.send(self._document)
+        return result.modified_count
+
+    def outstanding(self, minimum_score=1):
+        '''
+        Students whose weighted grade average is at least minimum_score, best first, ties broken by id.
+        '''
+        return self.filter(weighted_average__gte=minimum_score).order_by('-weighted_average', 'id')
+
+    def ranking(self, k, min_score=None, courses=None):
+        '''
+        The k graded students of this queryset with the highest weighted grade average, best first,
+        ties broken by id.
+
+        Without courses the stored averages are ranked by walking the weighted_average index and stopping after k.
+        With courses, a Course queryset, the averages only count the grades in those courses: they are computed
+        by an aggregation whose $sort is followed by the $limit, so the server keeps only the top k in memory.
+        Returns a list of (student_id, weighted_average) pairs.
+        '''
+        queryset = self.all_fields()
+        if courses is None:
+            queryset = queryset.filter(total_points__gt=0)
+            if min_score is not None:
+                queryset = queryset.filter(weighted_average__gte=min_score)
+            ranked = queryset.order_by('-weighted_average', 'id').limit(k).only('weighted_average').as_pymongo()
+            return [(student['_id'], student['weighted_average']) for student in ranked]
+
+        course_ids = list(courses.scalar('id'))
+        if not course_ids:
+            return []
+        graded = {'course': {'$in': course_ids}, 'grade': {'$ne': None}}
+        pipeline = [
+            {'$match': {'enrollments': {'$elemMatch': graded}}},
+            {'$unwind': '$enrollments'},
+            {'$match': dict(('enrollments.%s' % name, value) for name, value in graded.items())},
+            {'$group': {'_id': '$_id',
+                        'weighted_sum': {'$sum': {'$multiply': ['$enrollments.grade', '$enrollments.points']}},
+                        'total_points': {'$sum': '$enrollments.points'}}},
+            {'$match': {'total_points': {'$gt': 0}}},
+            {'$project': {'weighted_average': {'$divide': ['$weighted_sum', '$total_points']}}},
+        ]
+        if min_score is not None:
+            pipeline.append({'$match': {'weighted_average': {'$gte': min_score}}})
+        pipeline += [{'$sort': SON([('weighted_average', -1), ('_id', 1)])},
+                     {'$limit': k}]
+        return [(row['_id'], row['weighted_average']) for row in queryset.aggregate(*pipeline)]
 
 
 class Student(Document):
@@ -39,11 +341,204 @@ class Student(Document):
 
     enrollments = fields.EmbeddedDocumentListField('Enrollment')
 
+    # Lowercased name and city, for indexed case-insensitive prefix search
+    name_lower = fields.StringField()
+    city_lower = fields.StringField()
+
+    # Denormalized from enrollments, kept up to date by the enrol/grade paths
+    weighted_sum = fields.IntField(default=0)
+    total_points = fields.IntField(default=0)
+    weighted_average = fields.FloatField(default=0)
+
+    meta = {
+        'queryset_class': StudentQuerySet,
+        'indexes': [
+            # Ranks students, _id breaks ties
+            ('-weighted_average', 'id'),
+            'enrollments.course',
+            'name_lower',
+            'city_lower',
+            {'fields': ['$name', '$city'], 'default_language': 'none'},
+        ],
+    }
+
     def __repr__(self):
         return '<Student %s %s (%s enrollments)>' % (self.name, self.email, len(self.enrollments))
 
-    def enrolled_courses(self):
-        return map(lambda enrollment: enrollment.course, self.enrollments)
+    def clean(self):
+        self.name_lower = self.name.lower() if self.name else self.name
+        self.city_lower = self.city.lower() if self.city else self.city
 
     def enrol(self, course, grade=None):
-        self.enrollments.append(Enrollment(course=course, grade=grade))
+        grade = parse_grade(grade)
+        self.enrollments.append(Enrollment.for_course(course, grade=grade))
+        self._add_grade(course.points, grade)
+
+    def snapshot_courses(self):
+        '''
+        Copy the current course fields into the snapshot of every enrollment.
+        '''
+        prefetch_courses([self])
+        for enrollment in self.enrollments:
+            for name, value in Enrollment.snapshot(enrollment.course).items():
+                setattr(enrollment, name, value)
+
+    def recalculate_average(self):
+        self.snapshot_courses()
+        self.weighted_sum = 0
+        self.total_points = 0
+        for enrollment in self.enrollments:
+            self._add_grade(enrollment.points, enrollment.grade)
+        self.weighted_average = weighted_average(self.weighted_sum, self.total_points)
+
+    def _add_grade(self, points, grade):
+        if grade is not None:
+            self.weighted_sum += grade * points
+            self.total_points += points
+            self.weighted_average = weighted_average(self.weighted_sum, self.total_points)
+
+
+class CourseStatsQuerySet(DocumentQuerySet):
+    def record_enrollments(self, course, count=1):
+        '''
+        Count count new enrollments to course.
+        '''
+        if count:
+            self._document._get_collection().update_one({'_id': course.pk}, {'$inc': {'enrolled': count, 'version': 1}})
+
+    def record_grades(self, course, changes):
+        '''
+        Move the grade counts of course by changes, (previous grade, new grade) pairs where None is ungraded.
+
+        Like record_enrollments, nothing is written for courses without stats yet, they are rebuilt when first read.
+        Every change bumps the version of the stats, see rebuild.
+        '''
+        increments = {}
+        for previous, grade in changes:
+            if previous is not None:
+                key = 'grades.%d' % previous
+                increments[key] = increments.get(key, 0) - 1
+            if grade is not None:
+                key = 'grades.%d' % grade
+                increments[key] = increments.get(key, 0) + 1
+        increments = dict((key, count) for key, count in increments.items() if count)
+        if increments:
+            increments['version'] = 1
+            self._document._get_collection().update_one({'_id': course.pk}, {'$inc': increments})
+
+    def invalidate(self, course_ids):
+        '''
+        Drop the stats of course_ids after writes that are not counted incrementally, they are rebuilt when read.
+        '''
+        if course_ids:
+            self._document._get_collection().delete_many({'_id': {'$in': list(course_ids)}})
+
+    def rebuild(self, course_ids):
+        '''
+        Recount the enrollments and grades of course_ids from the students with a single aggregation.
+
+        The stats are first marked stale, created if missing so that the changes counted while aggregating
+        are not skipped but bump their version. The counts are only replaced where the version didn't change,
+        the others stay stale and are rebuilt when next read.
+        Returns {course_id: CourseStats}.
+        '''
+        course_ids = list(course_ids)
+        if not course_ids:
+            return {}
+        collection = self._document._get_collection()
+        collection.bulk_write([UpdateOne({'_id': course_id},
+                                         {'$set': {'stale': True},
+                                          '$setOnInsert': {'enrolled': 0, 'grades': {}, 'version': 0}},
+                                         upsert=True)
+                               for course_id in course_ids], ordered=False)
+        # None matches the stats counted before they had a version
+        versions = dict((row['_id'], row.get('version'))
+                        for row in collection.find({'_id': {'$in': course_ids}}, {'version': True}))
+
+        stats = dict((course_id, {'_id': course_id, 'enrolled': 0, 'grades': {},
+                                  'version': versions.get(course_id) or 0, 'stale': False})
+                     for course_id in course_ids)
+        counts = Student.objects(enrollments__course__in=course_ids).aggregate(
+            {'$unwind': '$enrollments'},
+            {'$match': {'enrollments.course': {'$in': course_ids}}},
+            {'$group': {'_id': {'course': '$enrollments.course', 'grade': '$enrollments.grade'},
+                        'count': {'$sum': 1}}},
+        )
+        for row in counts:
+            course_stats = stats[row['_id']['course']]
+            course_stats['enrolled'] += row['count']
+            if row['_id'].get('grade') is not None:
+                course_stats['grades']['%d' % row['_id']['grade']] = row['count']
+        collection.bulk_write([ReplaceOne({'_id': course_id, 'version': versions.get(course_id)}, son)
+                               for course_id, son in stats.items()], ordered=False)
+        return dict((course_id, self._document._from_son(son)) for course_id, son in stats.items())
+
+    def for_courses(self, course_ids):
+        '''
+        The stats of course_ids, rebuilding those that are missing or stale.
+
+        Returns {course_id: CourseStats}.
+        '''
+        stats = self.in_bulk(list(course_ids))
+        missing = [course_id for course_id in course_ids if course_id not in stats or stats[course_id].stale]
+        if missing:
+            stats.update(self.rebuild(missing))
+        return stats
+
+
+class CourseStats(Document):
+    '''
+    Enrollment and grade counts of a course, moved with $inc by the enrol and grade paths.
+    '''
+    course = fields.ObjectIdField(primary_key=True)
+    enrolled = fields.IntField(default=0)
+    # Graded students per grade, keyed by the grade
+    grades = fields.DictField()
+    # Bumped by every change counted, and set while the stats are rebuilt
+    version = fields.IntField(default=0)
+    stale = fields.BooleanField(default=False)
+
+    meta = {
+        'queryset_class': CourseStatsQuerySet,
+    }
+
+    def __repr__(self):
+        return '<CourseStats %s (%s enrolled)>' % (self.course, self.enrolled)
+
+
+class Job(Document):
+    '''
+    A long running operation, run in chunks by the job runner of enrollments.jobs.
+    '''
+    kind = fields.StringField(required=True)
+    status = fields.StringField(choices=JOB_STATUSES, default=JOB_PENDING)
+    params = fields.DictField()
+    # The student filter of the job in MongoDB extended JSON, filters such as $text aren't valid DictField keys
+    query = fields.StringField()
+
+    total = fields.IntField()
+    processed = fields.IntField(default=0)
+    modified = fields.IntField(default=0)
+    errors = fields.ListField(fields.StringField())
+
+    # Checkpoint, the last student of the chunks done so far
+    last_id = fields.ObjectIdField()
+    # Runner that claimed the job, the job can be claimed again once its heartbeat is stale
+    owner = fields.StringField()
+    attempts = fields.IntField(default=0)
+
+    created_at = fields.DateTimeField(default=datetime.datetime.utcnow)
+    started_at = fields.DateTimeField()
+    heartbeat_at = fields.DateTimeField()
+    finished_at = fields.DateTimeField()
+
+    meta = {
+        'collection': 'jobs',
+        'queryset_class': DocumentQuerySet,
+        'indexes': [
+            ('status', 'created_at'),
+        ],
+    }
+
+    def __repr__(self):
+        return '<Job %s %s (%s)>' % (self.kind, self.id, self.status)
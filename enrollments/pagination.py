@@ -0,0 +1,143 @@
+import json
+
+import six
+from bson import ObjectId
+from bson.errors import InvalidId
+from django.conf import settings
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import CursorPagination
+
+
+def positive_int(value, cutoff=None):
+    '''
+    Parse a strictly positive integer, capped at cutoff. Raises ValueError.
+    '''
+    number = int(value)
+    if number <= 0:
+        raise ValueError('Expected a positive integer, got %s' % value)
+    return min(number, cutoff) if cutoff else number
+
+
+def _reverse_ordering(ordering):
+    return tuple(field[1:] if field.startswith('-') else '-' + field for field in ordering)
+
+
+class KeysetPagination(CursorPagination):
+    '''
+    Cursor pagination keyed on `_id`, or on one of the view's `cursor_ordering_fields`.
+
+    Every page is fetched with a range query on the ordering key instead of a skip,
+    so page N costs the same as page 1.
+    '''
+    ordering = 'id'
+    page_size_query_param = 'page_size'
+    ordering_query_param = 'ordering'
+
+    @property
+    def max_page_size(self):
+        return getattr(settings, 'MAX_PAGE_SIZE', 1000)
+
+    def get_page_size(self, request):
+        try:
+            return positive_int(request.query_params[self.page_size_query_param], cutoff=self.max_page_size)
+        except (KeyError, ValueError):
+            return self.page_size
+
+    def get_ordering(self, request, queryset, view):
+        ordering = request.query_params.get(self.ordering_query_param)
+        if ordering and ordering.lstrip('-') in getattr(view, 'cursor_ordering_fields', ()):
+            # `_id` breaks ties, positions are (key, _id) pairs so that they are unique
+            return (ordering, self.ordering)
+        return (self.ordering,)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        # CursorPagination.paginate_queryset, filtering on the compound position of orderings with a tie breaker.
+        # Positions are unique, so cursors never carry an offset.
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+
+        self.cursor = self.decode_cursor(request)
+        if self.cursor is None:
+            (offset, reverse, current_position) = (0, False, None)
+        else:
+            (offset, reverse, current_position) = self.cursor
+
+        if reverse:
+            queryset = queryset.order_by(*_reverse_ordering(self.ordering))
+        else:
+            queryset = queryset.order_by(*self.ordering)
+
+        if current_position is not None:
+            queryset = self._filter_after(queryset, current_position, reverse)
+
+        results = list(queryset[offset:offset + self.page_size + 1])
+        self.page = list(results[:self.page_size])
+
+        if len(results) > len(self.page):
+            has_following_position = True
+            following_position = self._get_position_from_instance(results[-1], self.ordering)
+        else:
+            has_following_position = False
+            following_position = None
+
+        if reverse:
+            self.page = list(reversed(self.page))
+            self.has_next = (current_position is not None) or (offset > 0)
+            self.has_previous = has_following_position
+            if self.has_next:
+                self.next_position = current_position
+            if self.has_previous:
+                self.previous_position = following_position
+        else:
+            self.has_next = has_following_position
+            self.has_previous = (current_position is not None) or (offset > 0)
+            if self.has_next:
+                self.next_position = following_position
+            if self.has_previous:
+                self.previous_position = current_position
+
+        if (self.has_previous or self.has_next) and self.template is not None:
+            self.display_page_controls = True
+
+        return self.page
+
+    def _filter_after(self, queryset, position, reverse):
+        # Documents following position in the order of the page, which is reversed for previous pages
+        order = self.ordering[0]
+        descending = order.startswith('-') != reverse
+        try:
+            if len(self.ordering) == 1:
+                return queryset.filter(**{order.lstrip('-') + ('__lt' if descending else '__gt'): ObjectId(position)})
+            value, pk = json.loads(position)
+            pk = ObjectId(pk)
+        except (TypeError, ValueError, InvalidId):
+            raise NotFound(self.invalid_cursor_message)
+        if value is not None and not isinstance(value, (six.integer_types, float)):
+            raise NotFound(self.invalid_cursor_message)
+
+        field = queryset._document._fields[order.lstrip('-')].db_field
+        # Missing keys sort as null, before any number
+        if descending:
+            beyond = [] if value is None else [{field: {'$lt': value}}, {field: None}]
+        else:
+            beyond = [{field: {'$ne': None}}] if value is None else [{field: {'$gt': value}}]
+        tie = {field: value, '_id': {'$gt': pk} if not reverse else {'$lt': pk}}
+        return queryset.filter(__raw__={'$or': beyond + [tie]})
+
+    def _get_position_from_instance(self, instance, ordering):
+        # Raw pymongo documents, from as_pymongo querysets, have their primary key under `_id`
+        if isinstance(instance, dict):
+            pk = instance['_id']
+        else:
+            pk = instance.pk
+        if len(ordering) > 1:
+            field_name = ordering[0].lstrip('-')
+            value = instance.get(field_name) if isinstance(instance, dict) else getattr(instance, field_name)
+            return json.dumps([value, six.text_type(pk)])
+        if isinstance(instance, dict) and ordering[0].lstrip('-') == 'id':
+            return six.text_type(pk)
+        return super(KeysetPagination, self)._get_position_from_instance(instance, ordering)
@@ -0,0 +1,50 @@
+import csv
+import json
+
+import six
+from django.conf import settings
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser
+
+
+class NDJSONParser(BaseParser):
+    '''
+    Parses newline delimited JSON into a list with one item per non-empty line.
+    '''
+    media_type = 'application/x-ndjson'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get('encoding', settings.DEFAULT_CHARSET)
+
+        try:
+            data = stream.read().decode(encoding)
+            return [json.loads(line) for line in data.splitlines() if line.strip()]
+        except ValueError as exc:
+            raise ParseError('NDJSON parse error - %s' % six.text_type(exc))
+
+
+def _cell(value):
+    if isinstance(value, six.binary_type):
+        value = value.decode('utf-8')
+    return (value or '').strip() or None
+
+
+class CSVParser(BaseParser):
+    '''
+    Parses CSV with a header row into a list with one dict per row. Empty cells are parsed as None.
+    '''
+    media_type = 'text/csv'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get('encoding', settings.DEFAULT_CHARSET)
+
+        try:
+            lines = stream.read().decode(encoding).splitlines()
+            if six.PY2:
+                lines = [line.encode('utf-8') for line in lines]
+            return [dict((_cell(key), _cell(value)) for key, value in row.items() if key is not None)
+                    for row in csv.DictReader(lines)]
+        except (csv.Error, UnicodeError) as exc:
+            raise ParseError('CSV parse error - %s' % six.text_type(exc))
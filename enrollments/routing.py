@@ -0,0 +1,50 @@
+from django.conf import settings
+from pymongo.common import HEARTBEAT_FREQUENCY
+from pymongo.read_preferences import SecondaryPreferred
+from rest_framework.permissions import SAFE_METHODS
+
+
+def secondary_reads():
+    return SecondaryPreferred(max_staleness=getattr(settings, 'MONGODB_MAX_STALENESS_SECONDS', 90))
+
+
+class ReadRoutingMixin(object):
+    '''
+    Sends the reads of the secondary_read_actions to secondaries with a bounded staleness,
+    when MONGODB_SECONDARY_READS is on. Other actions, writes and reads following them stay on the primary.
+
+    Views pass their querysets through route_reads. Responses name the read preference of their action
+    in X-Mongo-Read-Preference.
+    '''
+    secondary_read_actions = ()
+
+    def get_read_preference(self):
+        '''
+        Returns the read preference of the current action, or None for the connection default.
+        '''
+        if (getattr(settings, 'MONGODB_SECONDARY_READS', False) and self.request.method in SAFE_METHODS and
+                self.action in self.secondary_read_actions):
+            return secondary_reads()
+        return None
+
+    def route_reads(self, queryset):
+        read_preference = self.get_read_preference()
+        if read_preference is None:
+            return queryset
+        return queryset.read_preference(read_preference)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super(ReadRoutingMixin, self).finalize_response(request, response, *args, **kwargs)
+        read_preference = self.get_read_preference()
+        response['X-Mongo-Read-Preference'] = read_preference.name if read_preference is not None else 'Primary'
+        return response
+
+    def read_staleness(self):
+        '''
+        Upper bound, in seconds, of how far behind the primary the reads of the current action may be.
+        '''
+        read_preference = self.get_read_preference()
+        if read_preference is None:
+            return 0
+        # The driver estimates secondary staleness once per heartbeat
+        return read_preference.max_staleness + HEARTBEAT_FREQUENCY
@@ -1,13 +1,33 @@
+from rest_framework import serializers
+from rest_framework_mongoengine.fields import ObjectIdField, ReferenceField
 from rest_framework_mongoengine.serializers import DocumentSerializer, EmbeddedDocumentSerializer
 
-from enrollments.models import Course, Student, Enrollment
+from enrollments.models import Course, Enrollment, Job, Student
+
+
+class RawReferenceField(ReferenceField):
+    '''
+    Reference represented by the id it holds, without loading the referenced document.
+    '''
+
+    def get_attribute(self, instance):
+        return instance._data.get(self.source)
 
 
 class EnrollmentSerializer(EmbeddedDocumentSerializer):
+    serializer_reference_field = RawReferenceField
+
     class Meta:
         model = Enrollment
         fields = '__all__'
 
+    def get_extra_kwargs(self):
+        # The serializers drf-mongoengine derives from this one for the enrollments of students replace Meta
+        extra_kwargs = super(EnrollmentSerializer, self).get_extra_kwargs()
+        for name in Enrollment.snapshot_fields:
+            extra_kwargs.setdefault(name, {})['read_only'] = True
+        return extra_kwargs
+
 
 class CourseSerializer(DocumentSerializer):
     class Meta:
@@ -16,6 +36,23 @@ class CourseSerializer(DocumentSerializer):
 
 
 class StudentSerializer(DocumentSerializer):
+    serializer_embedded_nested = EnrollmentSerializer
+
     class Meta:
         model = Student
-        fields = '__all__'
+        exclude = ('name_lower', 'city_lower')
+        read_only_fields = ('weighted_sum', 'total_points', 'weighted_average')
+
+
+class JobSerializer(DocumentSerializer):
+    class Meta:
+        model = Job
+        exclude = ('query', 'last_id', 'owner', 'heartbeat_at')
+
+
+class GradeSerializer(serializers.Serializer):
+    '''
+    A single row of a batch grade upload.
+    '''
+    student = ObjectIdField()
+    grade = serializers.IntegerField(allow_null=True)
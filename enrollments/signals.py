@@ -0,0 +1,7 @@
+from blinker import Namespace
+
+_signals = Namespace()
+
+# Sent with the document class as sender after writes that bypass the per-document
+# mongoengine signals, such as update_many or bulk_write.
+bulk_update = _signals.signal('bulk_update')
@@ -0,0 +1,47 @@
+from rest_framework.serializers import ListSerializer
+
+
+def _field_names(value):
+    return set(name.strip() for name in (value or '').split(',') if name.strip())
+
+
+class SparseFieldsMixin(object):
+    '''
+    Lets GET requests pick the returned fields with ?fields=a,b or drop some with ?exclude=a,b.
+
+    The serializer fields are trimmed, and views pass their querysets through sparse_queryset
+    so that fields which are not returned are not loaded from the database either.
+    '''
+    fields_query_param = 'fields'
+    exclude_query_param = 'exclude'
+
+    def get_sparse_fields(self):
+        '''
+        Returns the (fields, exclude) sets of field names requested, both empty unless this is a GET.
+        '''
+        if self.request is None or self.request.method != 'GET':
+            return set(), set()
+        return (_field_names(self.request.query_params.get(self.fields_query_param)),
+                _field_names(self.request.query_params.get(self.exclude_query_param)))
+
+    def sparse_queryset(self, queryset):
+        fields, exclude = self.get_sparse_fields()
+        model_fields = queryset._document._fields
+        # The pagination keys are always loaded, the serializer still leaves them out of the response
+        required = set(('id',) + tuple(getattr(self, 'cursor_ordering_fields', ())))
+        if fields:
+            queryset = queryset.only(*((fields & set(model_fields)) | required))
+        exclude = (exclude & set(model_fields)) - required
+        if exclude:
+            queryset = queryset.exclude(*exclude)
+        return queryset
+
+    def get_serializer(self, *args, **kwargs):
+        serializer = super(SparseFieldsMixin, self).get_serializer(*args, **kwargs)
+        fields, exclude = self.get_sparse_fields()
+        if fields or exclude:
+            child = serializer.child if isinstance(serializer, ListSerializer) else serializer
+            for name in list(child.fields):
+                if (fields and name not in fields) or name in exclude:
+                    child.fields.pop(name)
+        return serializer
@@ -0,0 +1,59 @@
+import math
+from collections import OrderedDict
+
+from enrollments.models import weighted_average
+
+# Width of the histogram buckets, grades of 100 fall in the last one
+HISTOGRAM_WIDTH = 10
+HISTOGRAM_BUCKETS = 10
+
+
+def _nth(counts, n):
+    # The nth smallest grade, 1-based, of sorted (grade, count) pairs
+    for grade, count in counts:
+        n -= count
+        if n <= 0:
+            return grade
+
+
+def histogram(counts):
+    buckets = [0] * HISTOGRAM_BUCKETS
+    for grade, count in counts:
+        buckets[max(0, min(grade // HISTOGRAM_WIDTH, HISTOGRAM_BUCKETS - 1))] += count
+    last = HISTOGRAM_BUCKETS - 1
+    return [OrderedDict([('min', bucket * HISTOGRAM_WIDTH),
+                         ('max', bucket * HISTOGRAM_WIDTH + HISTOGRAM_WIDTH - (0 if bucket == last else 1)),
+                         ('count', count)])
+            for bucket, count in enumerate(buckets)]
+
+
+def grade_statistics(stats):
+    '''
+    Summarize the grade distribution of (CourseStats, course points) pairs.
+
+    The weighted sum and total points are what the grades add to the weighted averages of the students,
+    their ratio is the points-weighted mean grade.
+    '''
+    enrolled = weighted_sum = total_points = 0
+    grades = {}
+    for course_stats, points in stats:
+        enrolled += course_stats.enrolled
+        for grade, count in course_stats.grades.items():
+            grade = int(grade)
+            grades[grade] = grades.get(grade, 0) + count
+            weighted_sum += grade * count * points
+            total_points += count * points
+
+    counts = sorted((grade, count) for grade, count in grades.items() if count > 0)
+    graded = sum(count for _, count in counts)
+    summary = OrderedDict([('enrolled', enrolled), ('graded', graded),
+                           ('mean', None), ('median', None), ('p90', None)])
+    if graded:
+        summary['mean'] = float(sum(grade * count for grade, count in counts)) / graded
+        summary['median'] = (_nth(counts, (graded + 1) // 2) + _nth(counts, graded // 2 + 1)) / 2.0
+        summary['p90'] = _nth(counts, int(math.ceil(0.9 * graded)))
+    summary['histogram'] = histogram(counts)
+    summary['weighted_sum'] = weighted_sum
+    summary['total_points'] = total_points
+    summary['weighted_average'] = weighted_average(weighted_sum, total_points)
+    return summary
@@ -0,0 +1,29 @@
+'''
+The server the blackbox tests run against, and helpers to call it.
+'''
+import requests
+
+HOST = 'http://localhost:8000/api/'
+COURSES_API_ROOT = HOST + 'courses/'
+STUDENTS_API_ROOT = HOST + 'students/'
+
+
+def path_for_course(course):
+    return COURSES_API_ROOT + course['id'] + '/'
+
+
+def path_for_student(student):
+    return STUDENTS_API_ROOT + student['id'] + '/'
+
+
+def get_student(student_path):
+    return requests.get(student_path).json()
+
+
+def grade(course, student, grade):
+    enrollment_data = {
+        'course': course['id'],
+        'grade': grade
+    }
+    r = requests.post(path_for_student(student) + 'grade/', data=enrollment_data)
+    assert r.ok
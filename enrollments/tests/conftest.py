@@ -0,0 +1,69 @@
+'''
+Django configuration and fixtures shared by the test modules.
+'''
+import os
+
+import django
+import pytest
+import requests
+
+from enrollments.tests.api import COURSES_API_ROOT, STUDENTS_API_ROOT, path_for_course, path_for_student
+
+
+def pytest_configure():
+    # The in-process tests use the documents and job runners of the configured settings
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'unirest.settings')
+    django.setup()
+
+
+@pytest.fixture
+def course():
+    data = {
+        'faculty': 'Computer Science',
+        'subject': 'Linear Algebra',
+        'description': 'Oh no',
+        'year': 2017,
+        'semester': '1',
+        'points': 3
+    }
+
+    r = requests.post(COURSES_API_ROOT, data=data)
+    assert r.ok
+    course = r.json()
+
+    assert course['subject'] == data['subject']
+    yield course
+    course_path = path_for_course(course)
+
+    r = requests.delete(course_path)
+    assert r.ok or r.status_code == 404
+
+    r = requests.get(course_path)
+    assert r.status_code == 404
+
+
+@pytest.fixture
+def student():
+    data = {
+        "name": "Natalie",
+        "city": "Haifa",
+        "email": "aa@aa.aa",
+        "year_of_birth": 1987,
+        "enrollments": []
+    }
+
+    r = requests.post(STUDENTS_API_ROOT, data=data)
+    assert r.ok
+
+    student = r.json()
+    student_path = path_for_student(student)
+    r = requests.get(student_path)
+    assert r.ok
+    assert data['name'] == student['name']
+
+    yield student
+    r = requests.delete(student_path)
+    assert r.ok
+
+    r = requests.get(student_path)
+    assert r.status_code == 404
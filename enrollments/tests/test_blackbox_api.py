@@ -1,83 +1,26 @@
+import base64
+import json
+import re
+import time
+
 import pytest
 import requests
 
-HOST = 'http://localhost:8000/api/'
-COURSES_API_ROOT = HOST + 'courses/'
-STUDENTS_API_ROOT = HOST + 'students/'
-
-
-def path_for_course(course):
-    return COURSES_API_ROOT + course['id'] + '/'
-
-
-def path_for_student(student):
-    return STUDENTS_API_ROOT + student['id'] + '/'
-
-
-def get_student(student_path):
-    return requests.get(student_path).json()
-
-
-@pytest.fixture
-def course():
-    data = {
-        'faculty': 'Computer Science',
-        'subject': 'Linear Algebra',
-        'description': 'Oh no',
-        'year': 2017,
-        'semester': '1',
-        'points': 3
-    }
-
-    r = requests.post(COURSES_API_ROOT, data=data)
-    assert r.ok
-    course = r.json()
-
-    assert course['subject'] == data['subject']
-    yield course
-    course_path = path_for_course(course)
-
-    r = requests.delete(course_path)
-    assert r.ok or r.status_code == 404
-
-    r = requests.get(course_path)
-    assert r.status_code == 404
-
-
-@pytest.fixture
-def student():
-    data = {
-        "name": "Natalie",
-        "city": "Haifa",
-        "email": "aa@aa.aa",
-        "year_of_birth": 1987,
-        "enrollments": []
-    }
-
-    r = requests.post(STUDENTS_API_ROOT, data=data)
-    assert r.ok
-
-    student = r.json()
-    student_path = path_for_student(student)
-    r = requests.get(student_path)
-    assert r.ok
-    assert data['name'] == student['name']
-
-    yield student
-    r = requests.delete(student_path)
-    assert r.ok
-
-    r = requests.get(student_path)
-    assert r.status_code == 404
+from enrollments.models import Course
+from enrollments.tests.api import (COURSES_API_ROOT, HOST, STUDENTS_API_ROOT, get_student, grade, path_for_course,
+                                   path_for_student)
 
 
 def test_delete_course_de_enrol(student, course):
     enrol(course, student)
+    grade(course, student, 95)
     r = requests.delete(path_for_course(course))
     assert r.ok
+    assert r.json()['affected_students'] == 1
 
     student = get_student(path_for_student(student))
     assert len(student['enrollments']) == 0
+    assert student['weighted_average'] == 0
 
 
 def test_outstanding(student, course):
@@ -110,9 +53,17 @@ def test_bulk_enrol(student, course):
     assert_enrolled_students(course, count=0)
     r = requests.post(STUDENTS_API_ROOT + 'bulk_enrol/', params={'course': course['id'], 'name': 'Na'})
     assert r.ok
+    assert r.json()['modified'] == 1
 
     assert_enrolled_students(course, count=1)
 
+    r = requests.post(STUDENTS_API_ROOT + 'bulk_enrol/', params={'course': course['id'], 'name': 'Na', 'echo': 1})
+    assert r.ok
+    assert r.json()['matched'] == 1
+    assert r.json()['modified'] == 0
+    assert len(r.json()['students']['results']) == 1
+    assert len(get_student(path_for_student(student))['enrollments']) == 1
+
 
 def test_get_enrolled_students(student, course):
     assert_enrolled_students(course, count=0)
@@ -141,13 +92,88 @@ def test_course_filters(course):
 
 def verify_filter(response, empty=False):
     assert response.ok
-    filtered = response.json()
+    filtered = response.json()['results']
     if empty:
         assert len(filtered) == 0
     else:
         assert len(filtered) == 1
 
 
+def test_course_pagination(course):
+    data = dict(course, subject='Linear Algebra 2')
+    del data['id']
+    r = requests.post(COURSES_API_ROOT, data=data)
+    assert r.ok
+    second_course = r.json()
+
+    r = requests.get(COURSES_API_ROOT, params={'page_size': 1})
+    assert r.ok
+    first_page = r.json()
+    assert len(first_page['results']) == 1
+    assert first_page['previous'] is None
+
+    r = requests.get(first_page['next'])
+    assert r.ok
+    second_page = r.json()
+    assert len(second_page['results']) == 1
+    assert second_page['results'][0]['id'] != first_page['results'][0]['id']
+
+    r = requests.delete(path_for_course(second_course))
+    assert r.ok
+
+
+def test_invalid_cursor():
+    # Cursors are base64 encoded query strings, tampered positions are not found
+    for params in ({}, {'ordering': '-weighted_average'}):
+        for position in ('garbage', '["garbage", "garbage"]', '[1, 2, 3]'):
+            cursor = base64.b64encode(('p=' + position).encode('ascii')).decode('ascii')
+            r = requests.get(STUDENTS_API_ROOT, params=dict(params, cursor=cursor))
+            assert r.status_code == 404
+    r = requests.get(COURSES_API_ROOT, params={'cursor': 'not base64'})
+    assert r.status_code == 404
+
+
+def walk_pages(url, params, link='next'):
+    ids = []
+    while url:
+        r = requests.get(url, params=params)
+        assert r.ok
+        page = r.json()
+        ids.extend(result['id'] for result in page['results'])
+        url, params = page[link], None
+    return ids
+
+
+def test_student_pagination_equal_averages(course):
+    # Averages shared by many students, and students without one
+    data = [{'name': 'Keyset', 'city': 'Haifa', 'email': 'keyset%d@aa.aa' % i, 'year_of_birth': 1990,
+             'enrollments': [{'course': course['id'], 'grade': 70 + 10 * (i % 2)}] if i % 3 else []}
+            for i in range(30)]
+    r = requests.post(STUDENTS_API_ROOT + 'bulk/', json=data)
+    assert r.status_code == 201
+    created = [result['id'] for result in r.json()]
+
+    for ordering in ('-weighted_average', 'weighted_average'):
+        forward = walk_pages(STUDENTS_API_ROOT, {'name': 'Keyset', 'ordering': ordering, 'page_size': 4})
+        assert len(forward) == len(set(forward)) == len(created)
+        assert set(forward) == set(created)
+
+        # Back from the last page
+        r = requests.get(STUDENTS_API_ROOT, params={'name': 'Keyset', 'ordering': ordering, 'page_size': 4})
+        url = r.json()['next']
+        while True:
+            page = requests.get(url).json()
+            if not page['next']:
+                break
+            url = page['next']
+        backward = walk_pages(page['previous'], None, link='previous')
+        assert len(backward) == len(set(backward)) == len(created) - len(page['results'])
+        assert set(backward) == set(forward[:len(backward)])
+
+    for pk in created:
+        assert requests.delete(STUDENTS_API_ROOT + pk + '/').ok
+
+
 def test_patch_course(course):
     course_path = path_for_course(course)
 
@@ -179,6 +205,12 @@ def test_cant_enrol_twice(student, course):
     assert not r.ok
 
 
+def test_cant_grade_without_enrollment(student, course):
+    r = requests.post(path_for_student(student) + 'grade/', data={'course': course['id'], 'grade': 90})
+    assert r.status_code == 400
+    assert get_student(path_for_student(student))['total_points'] == 0
+
+
 def test_basic_enrollment(student, course):
     enrol(course, student)
 
@@ -208,18 +240,409 @@ def test_assign_a_student_to_a_course_and_grade(student, course):
     verify_enrollment(course, enrollment_data, student_path)
 
 
-def grade(course, student, grade):
-    enrollment_data = {
-        'course': course['id'],
-        'grade': grade
-    }
-    r = requests.post(path_for_student(student) + 'grade/', data=enrollment_data)
-    assert r.ok
-
-
 def verify_enrollment(course, enrollment, student_path):
     student = get_student(student_path)
     enrollments = student['enrollments']
     assert len(enrollments) == 1
     assert enrollments[0]['course'] == course['id']
     assert enrollments[0]['grade'] == enrollment['grade']
+
+
+def test_outstanding_filters(student, course):
+    enrol(course, student)
+    grade(course, student, 95)
+    r = requests.get(STUDENTS_API_ROOT + 'outstanding/', params={'name': 'Nat'})
+    assert r.ok
+    assert len(r.json()) == 1
+
+    r = requests.get(STUDENTS_API_ROOT + 'outstanding/', params={'city': 'Tel'})
+    assert r.ok
+    assert len(r.json()) == 0
+
+
+def test_weighted_average_maintained(student, course):
+    enrol(course, student)
+    grade(course, student, 80)
+    student = get_student(path_for_student(student))
+    assert student['weighted_average'] == 80
+    assert student['total_points'] == course['points']
+
+    r = requests.patch(path_for_course(course), data={'points': 5})
+    assert r.ok
+    grade(course, student, 90)
+    student = get_student(path_for_student(student))
+    assert student['weighted_sum'] == 450
+    assert student['weighted_average'] == 90
+
+
+def test_enrolled_students_filters(student, course):
+    enrol(course, student)
+    r = requests.get(STUDENTS_API_ROOT + 'enrolled/', params={'course': course['id'], 'name': 'Nat'})
+    assert r.ok
+    assert len(r.json()) == 1
+
+    r = requests.get(STUDENTS_API_ROOT + 'enrolled/', params={'course': course['id'], 'minimal_year': '2000'})
+    assert r.ok
+    assert len(r.json()) == 0
+
+
+def test_student_search_filters(student):
+    verify_filter(requests.get(STUDENTS_API_ROOT, params={'name_prefix': 'nat'}))
+    verify_filter(requests.get(STUDENTS_API_ROOT, params={'name_prefix': 'tal'}), empty=True)
+    verify_filter(requests.get(STUDENTS_API_ROOT, params={'city_prefix': 'HAI'}))
+    verify_filter(requests.get(STUDENTS_API_ROOT, params={'city_prefix': 'Tel'}), empty=True)
+
+
+def test_student_text_search(student):
+    if requests.get(STUDENTS_API_ROOT, params={'name': 'Nat'}).headers['X-Mongo-Queries'] == '0':
+        pytest.skip('The mongo client reports no commands, as with mongomock, which has no $text')
+    verify_filter(requests.get(STUDENTS_API_ROOT, params={'q': 'haifa'}))
+    verify_filter(requests.get(STUDENTS_API_ROOT, params={'q': 'Jerusalem'}), empty=True)
+    verify_filter(requests.get(STUDENTS_API_ROOT, params={'q': 'natalie', 'minimal_year': 1980}))
+    verify_filter(requests.get(STUDENTS_API_ROOT, params={'q': 'natalie', 'minimal_year': 1990}), empty=True)
+
+
+def test_etag_revalidation(course):
+    course_path = path_for_course(course)
+    r = requests.get(course_path)
+    assert r.ok
+    etag = r.headers['ETag']
+
+    r = requests.get(course_path, headers={'If-None-Match': etag})
+    assert r.status_code == 304
+    assert not r.content
+
+    r = requests.patch(course_path, data={'subject': 'Linear Algebra 2'})
+    assert r.ok
+    r = requests.get(course_path, headers={'If-None-Match': etag})
+    assert r.ok
+    assert r.json()['subject'] == 'Linear Algebra 2'
+    assert r.headers['ETag'] != etag
+
+
+def test_export(student, course):
+    enrol(course, student)
+    r = requests.get(STUDENTS_API_ROOT + 'export/', params={'name': 'Nat'})
+    assert r.ok
+    assert r.headers['Content-Type'] == 'application/x-ndjson'
+    lines = r.text.splitlines()
+    assert len(lines) == 1
+    assert json.loads(lines[0])['enrollments'][0]['course'] == course['id']
+
+    r = requests.get(STUDENTS_API_ROOT + 'export/', params={'name': 'Lucy'})
+    assert r.ok
+    assert r.text == ''
+
+    r = requests.get(COURSES_API_ROOT + 'export/', params={'minimal_points': 1})
+    assert r.ok
+    assert [json.loads(line)['id'] for line in r.text.splitlines()] == [course['id']]
+
+
+def test_bulk_create_students(student, course):
+    data = [
+        {'name': 'Lucy', 'city': 'Haifa', 'email': 'lucy@aa.aa', 'year_of_birth': 1990,
+         'enrollments': [{'course': course['id'], 'grade': 90}]},
+        {'name': 'Dup', 'city': 'Haifa', 'email': student['email'], 'year_of_birth': 1990},
+        {'name': 'Broken', 'city': 'Haifa'},
+    ]
+    r = requests.post(STUDENTS_API_ROOT + 'bulk/', json=data)
+    assert r.status_code == 207
+    created, duplicate, invalid = r.json()
+    assert 'errors' in duplicate
+    assert 'email' in invalid['errors']
+
+    lucy_path = STUDENTS_API_ROOT + created['id'] + '/'
+    lucy = get_student(lucy_path)
+    assert lucy['weighted_average'] == 90
+    assert_enrolled_students(course, count=1)
+    assert requests.delete(lucy_path).ok
+
+
+def test_bulk_create_courses_ndjson():
+    lines = [json.dumps({'faculty': 'Math', 'subject': 'Calculus %d' % i, 'description': 'Limits',
+                         'year': 2017, 'semester': '1', 'points': 3}) for i in range(3)]
+    r = requests.post(COURSES_API_ROOT + 'bulk/', data='\n'.join(lines),
+                      headers={'Content-Type': 'application/x-ndjson'})
+    assert r.status_code == 201
+    for result in r.json():
+        assert requests.delete(COURSES_API_ROOT + result['id'] + '/').ok
+
+
+def test_batch_grades(student, course):
+    enrol(course, student)
+    grades_path = path_for_course(course) + 'grades/'
+    r = requests.post(grades_path, json=[{'student': student['id'], 'grade': 70},
+                                         {'student': student['id'], 'grade': 'A'}])
+    assert r.status_code == 400
+    assert 'errors' in r.json()[1]
+    assert get_student(path_for_student(student))['enrollments'][0]['grade'] is None
+
+    r = requests.post(grades_path, data='student,grade\n%s,70\n' % student['id'],
+                      headers={'Content-Type': 'text/csv'})
+    assert r.ok
+    assert r.json() == [{'index': 0, 'student': student['id'], 'grade': 70, 'previous_grade': None}]
+    student = get_student(path_for_student(student))
+    assert student['enrollments'][0]['grade'] == 70
+    assert student['weighted_average'] == 70
+
+
+def test_sparse_fields(student, course):
+    enrol(course, student)
+    r = requests.get(STUDENTS_API_ROOT, params={'fields': 'id,name,email', 'name': 'Nat'})
+    assert r.ok
+    assert r.json()['results'] == [{'id': student['id'], 'name': 'Natalie', 'email': 'aa@aa.aa'}]
+
+    r = requests.get(path_for_student(student), params={'exclude': 'enrollments'})
+    assert r.ok
+    assert 'enrollments' not in r.json()
+    assert r.json()['name'] == 'Natalie'
+
+
+def last_mongo_commands(response):
+    '''
+    The commands of the request of response, the latest one listed by the debug panel.
+    '''
+    assert int(response.headers['X-Mongo-Queries']) <= int(response.headers['X-Mongo-Query-Budget'])
+    r = requests.get(HOST.replace('api/', 'debug/mongo/'))
+    if r.status_code == 404:
+        pytest.skip('The server runs without MONGO_DEBUG_PANEL')
+    assert r.ok
+    latest = r.json()['requests'][0]
+    assert response.url.endswith(latest['path'])
+    return latest['commands']
+
+
+def test_sparse_fields_projection(student, course):
+    enrol(course, student)
+    list_commands = last_mongo_commands(
+        requests.get(STUDENTS_API_ROOT, params={'fields': 'id,name', 'name': 'Nat'}))
+    detail_commands = last_mongo_commands(requests.get(path_for_student(student), params={'exclude': 'enrollments'}))
+    if not list_commands:
+        pytest.skip('The mongo client reports no commands, as with mongomock')
+
+    # A single find, loading neither the enrollments nor their courses
+    assert [(command['command'], command['collection']) for command in list_commands] == [('find', 'student')]
+    assert 'name' in list_commands[0]['projection']
+    assert 'enrollments' not in list_commands[0]['projection']
+    assert [command['command'] for command in detail_commands] == ['find']
+    assert detail_commands[0]['projection'] == {'enrollments': 0}
+
+
+def test_mongo_instrumentation_headers(student):
+    r = requests.get(STUDENTS_API_ROOT)
+    assert r.ok
+    assert int(r.headers['X-Mongo-Queries']) <= int(r.headers['X-Mongo-Query-Budget'])
+    assert 'mongo;dur=' in r.headers['Server-Timing']
+
+
+def test_metrics(course):
+    assert requests.get(path_for_course(course)).ok
+    r = requests.get(HOST.replace('api/', 'metrics'))
+    assert r.ok
+    assert 'unirest_requests_total{method="GET",route="courses-detail",status="2xx"}' in r.text
+    assert 'unirest_request_duration_seconds_bucket{le="+Inf",method="GET",route="courses-detail"}' in r.text
+
+
+def set_grades(course, grades):
+    rows = [{'student': student_id, 'grade': value} for student_id, value in grades.items()]
+    r = requests.post(path_for_course(course) + 'grades/', json=rows)
+    assert r.ok
+
+
+def test_ranking(student, course):
+    r = requests.post(STUDENTS_API_ROOT, data={'name': 'Noa', 'city': 'Acre', 'email': 'bb@bb.bb',
+                                               'year_of_birth': 1990})
+    assert r.ok
+    second = r.json()
+    r = requests.post(COURSES_API_ROOT, data={'faculty': 'Physics', 'subject': 'Optics', 'description': 'Light',
+                                              'year': 2017, 'semester': '1', 'points': 1})
+    assert r.ok
+    physics = r.json()
+    try:
+        for enrolled in (student, second):
+            for enrolled_course in (course, physics):
+                r = requests.post(path_for_student(enrolled) + 'enrol/', data={'course': enrolled_course['id']})
+                assert r.ok
+        set_grades(course, {student['id']: 80, second['id']: 90})
+        set_grades(physics, {student['id']: 100, second['id']: 60})
+
+        r = requests.get(STUDENTS_API_ROOT + 'ranking/', params={'name': 'N', 'k': 1})
+        assert r.ok
+        assert [(row['rank'], row['student']['id']) for row in r.json()] == [(1, student['id'])]
+        assert r.json()[0]['score'] == 85
+
+        r = requests.get(STUDENTS_API_ROOT + 'ranking/', params={'name': 'N', 'faculty': 'Computer Science'})
+        assert [(row['student']['id'], row['score']) for row in r.json()] == [(second['id'], 90), (student['id'], 80)]
+
+        r = requests.get(STUDENTS_API_ROOT + 'ranking/', params={'course': physics['id'], 'min_score': 70})
+        assert [(row['student']['id'], row['score']) for row in r.json()] == [(student['id'], 100)]
+
+        # Scoped rankings follow the courses moving in and out of the scope
+        assert requests.patch(path_for_course(physics), data={'faculty': 'Computer Science'}).ok
+        r = requests.get(STUDENTS_API_ROOT + 'ranking/', params={'name': 'N', 'faculty': 'Computer Science'})
+        assert [row['student']['id'] for row in r.json()] == [student['id'], second['id']]
+        assert r.json()[0]['score'] == 85
+
+        # Equal averages are ranked by id
+        set_grades(course, {second['id']: 80})
+        set_grades(physics, {second['id']: 100})
+        r = requests.get(STUDENTS_API_ROOT + 'ranking/', params={'name': 'N'})
+        assert [row['student']['id'] for row in r.json()] == sorted([student['id'], second['id']])
+
+        assert requests.get(STUDENTS_API_ROOT + 'ranking/', params={'k': 0}).status_code == 400
+        assert requests.get(STUDENTS_API_ROOT + 'ranking/', params={'course': 'nope'}).status_code == 400
+    finally:
+        requests.delete(path_for_student(second))
+        requests.delete(path_for_course(physics))
+
+
+def test_course_stats(student, course):
+    r = requests.get(path_for_course(course) + 'stats/')
+    assert r.ok
+    assert (r.json()['enrolled'], r.json()['graded'], r.json()['mean']) == (0, 0, None)
+
+    enrol(course, student)
+    grade(course, student, 91)
+    r = requests.get(path_for_course(course) + 'stats/')
+    stats = r.json()
+    assert (stats['enrolled'], stats['graded'], stats['mean'], stats['median'], stats['p90']) == (1, 1, 91, 91, 91)
+    assert stats['histogram'][-1] == {'min': 90, 'max': 100, 'count': 1}
+    assert (stats['weighted_sum'], stats['total_points']) == (91 * course['points'], course['points'])
+
+    set_grades(course, {student['id']: 70})
+    r = requests.get(COURSES_API_ROOT + 'stats/', params={'faculty': course['faculty'], 'year': course['year']})
+    assert r.ok
+    assert r.json()['courses'] >= 1
+    assert r.json()['histogram'][7]['count'] >= 1
+    assert requests.get(COURSES_API_ROOT + 'stats/', params={'year': 'x'}).status_code == 400
+
+    assert requests.patch(path_for_student(student), json={'enrollments': []}).ok
+    assert requests.get(path_for_course(course) + 'stats/').json()['enrolled'] == 0
+
+
+def wait_for_job(job):
+    for _ in range(50):
+        r = requests.get(HOST + 'jobs/' + job['id'] + '/')
+        assert r.ok
+        if r.json()['status'] in ('done', 'failed'):
+            return r.json()
+        time.sleep(0.1)
+    raise AssertionError('Job %s still %s' % (job['id'], r.json()['status']))
+
+
+def test_async_jobs(student, course):
+    r = requests.post(STUDENTS_API_ROOT + 'bulk_enrol/', params={'course': course['id'], 'name': 'Nat', 'async': 1})
+    assert r.status_code == 202
+    assert r.headers['Location'].endswith('/api/jobs/%s/' % r.json()['id'])
+    job = wait_for_job(r.json())
+    assert (job['status'], job['kind'], job['total'], job['processed'], job['modified']) == (
+        'done', 'bulk_enrol', 1, 1, 1)
+    assert len(get_student(path_for_student(student))['enrollments']) == 1
+
+    r = requests.delete(path_for_course(course), params={'async': 1})
+    assert r.status_code == 202
+    job = wait_for_job(r.json())
+    assert (job['status'], job['modified']) == ('done', 1)
+    assert requests.get(path_for_course(course)).status_code == 404
+    assert get_student(path_for_student(student))['enrollments'] == []
+
+
+def test_enrollment_course_snapshot(student, course):
+    enrol(course, student)
+    grade(course, student, 80)
+    enrollment = get_student(path_for_student(student))['enrollments'][0]
+    assert (enrollment['subject'], enrollment['semester'], enrollment['points']) == (
+        course['subject'], course['semester'], course['points'])
+
+    r = requests.patch(path_for_course(course), data={'subject': 'Abstract Algebra', 'points': 5})
+    assert r.ok
+    for params in ({}, {'fast': 0}):
+        student_data = requests.get(path_for_student(student), params=params).json()
+        enrollment = student_data['enrollments'][0]
+        assert (enrollment['course'], enrollment['subject'], enrollment['points']) == (
+            course['id'], 'Abstract Algebra', 5)
+        assert student_data['weighted_sum'] == 400
+
+    # Snapshots are read only, they are copied from the course
+    r = requests.patch(path_for_student(student), json={'enrollments': [{'course': course['id'], 'grade': 90,
+                                                                         'subject': 'Other', 'points': 1}]})
+    assert r.ok
+    assert (r.json()['enrollments'][0]['subject'], r.json()['weighted_sum']) == ('Abstract Algebra', 450)
+
+
+def course_cache_counter(name):
+    r = requests.get(HOST.replace('api/', 'metrics'))
+    assert r.ok
+    return int(re.search(r'^unirest_course_cache_%s_total (\d+)$' % name, r.text, re.M).group(1))
+
+
+def test_course_cache(student, course):
+    enrol(course, student)
+    grade(course, student, 80)
+    requests.get(STUDENTS_API_ROOT + 'enrolled/', params={'course': course['id']})
+    hits = course_cache_counter('hits')
+    # Another response, with the course from the cache
+    assert requests.get(STUDENTS_API_ROOT + 'enrolled/', params={'course': course['id'], 'name': 'Nat'}).ok
+    assert course_cache_counter('hits') > hits
+
+    # Writes load the course from the database, and grade by the points of the enrollment
+    hits = course_cache_counter('hits')
+    assert requests.patch(path_for_course(course), data={'points': 5}).ok
+    grade(course, student, 90)
+    assert course_cache_counter('hits') == hits
+    assert get_student(path_for_student(student))['weighted_sum'] == 450
+
+
+def test_student_write_reads_courses(student, course):
+    # Warm the course cache of the server, then change the course as another worker would, without invalidating it
+    assert requests.get(STUDENTS_API_ROOT + 'enrolled/', params={'course': course['id']}).ok
+    Course.objects(id=course['id']).update_one(set__points=5)
+    if requests.get(path_for_course(course), params={'fields': 'id,points'}).json()['points'] != 5:
+        pytest.skip('The server does not share the database of the tests, as with mongomock')
+
+    r = requests.put(path_for_student(student), json=dict(student, enrollments=[{'course': course['id'], 'grade': 80}]))
+    assert r.ok
+    assert (r.json()['enrollments'][0]['points'], r.json()['weighted_sum']) == (5, 400)
+    student_data = get_student(path_for_student(student))
+    assert (student_data['enrollments'][0]['points'], student_data['weighted_average']) == (5, 80)
+
+    data = dict(student, email='bulk@aa.aa', enrollments=[{'course': course['id'], 'grade': 80}])
+    del data['id']
+    r = requests.post(STUDENTS_API_ROOT + 'bulk/', json=[data])
+    assert r.status_code == 201
+    created_path = STUDENTS_API_ROOT + r.json()[0]['id'] + '/'
+    student_data = get_student(created_path)
+    assert (student_data['enrollments'][0]['points'], student_data['weighted_sum']) == (5, 400)
+    assert requests.delete(created_path).ok
+
+
+def test_api_schema():
+    url = HOST.replace('api/', 'docs/')
+    r = requests.get(url, params={'format': 'openapi'})
+    assert r.ok
+    schema = r.json()
+    assert schema['info']['title'] == 'Unirest API'
+    assert '/api/students/ranking/' in schema['paths']
+    # Served from the schema built once
+    assert requests.get(url, params={'format': 'openapi'}).content == r.content
+
+    r = requests.get(url, headers={'Accept': 'text/html'})
+    assert r.ok and 'swagger' in r.text.lower()
+
+
+def test_read_routing(student, course):
+    if requests.get(STUDENTS_API_ROOT).headers['X-Mongo-Read-Preference'] == 'Primary':
+        pytest.skip('The server runs without MONGODB_SECONDARY_READS')
+
+    # Reporting reads may lag, detail reads, writes and the reads of writes stay on the primary
+    for url in (STUDENTS_API_ROOT, STUDENTS_API_ROOT + 'outstanding/', STUDENTS_API_ROOT + 'valedictorian/',
+                COURSES_API_ROOT):
+        assert requests.get(url).headers['X-Mongo-Read-Preference'] == 'SecondaryPreferred'
+    assert requests.get(path_for_student(student)).headers['X-Mongo-Read-Preference'] == 'Primary'
+    r = requests.post(path_for_student(student) + 'enrol/', data={'course': course['id']})
+    assert r.ok and r.headers['X-Mongo-Read-Preference'] == 'Primary'
+    r = requests.post(path_for_student(student) + 'grade/', data={'course': course['id'], 'grade': 80})
+    assert r.ok and r.headers['X-Mongo-Read-Preference'] == 'Primary'
+    assert r.json()['weighted_average'] == 80
+    assert requests.patch(path_for_student(student), data={'city': 'Acre'}).headers['X-Mongo-Read-Preference'] == \
+        'Primary'
@@ -0,0 +1,13 @@
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def test_boot_before_fork():
+    # Preforking servers load the application once, in the parent of all workers:
+    # it must not hold mongo clients or threads by then
+    for settings in ('unirest.settings', 'unirest.settings_production'):
+        command = [sys.executable, '-m', 'benchmarks.boot', '--settings', settings, '--check', '--top', '0']
+        subprocess.check_call(command, cwd=ROOT)
@@ -0,0 +1,69 @@
+import pytest
+import requests
+
+from enrollments.tests.api import COURSES_API_ROOT, STUDENTS_API_ROOT, grade, path_for_course, path_for_student
+
+
+def assert_parity(url, params=None):
+    '''
+    The fast read path must render exactly the bytes of the serializer path, selected with fast=0.
+    '''
+    fast = requests.get(url, params=params)
+    slow = requests.get(url, params=dict(params or {}, fast=0))
+    assert fast.status_code == slow.status_code
+    assert fast.content == slow.content
+    return fast
+
+
+@pytest.fixture
+def second_course():
+    data = {
+        'faculty': 'Mathematics',
+        'subject': 'Topology',
+        'description': u'Espaces topologiques \u00e9l\u00e9mentaires',
+        'year': 2016,
+        'semester': '2',
+        'points': 5
+    }
+    r = requests.post(COURSES_API_ROOT, json=data)
+    assert r.ok
+    yield r.json()
+    requests.delete(path_for_course(r.json()))
+
+
+@pytest.fixture
+def enrolled_student(student, course, second_course):
+    for enrolled_course in (course, second_course):
+        r = requests.post(path_for_student(student) + 'enrol/', data={'course': enrolled_course['id']})
+        assert r.ok
+    grade(course, student, 77)
+    return student
+
+
+def test_student_list_parity(enrolled_student):
+    r = assert_parity(STUDENTS_API_ROOT)
+    assert r.json()['results']
+    assert_parity(STUDENTS_API_ROOT, {'name': 'Nat', 'minimal_year': '1980'})
+    assert_parity(STUDENTS_API_ROOT, {'fields': 'id,enrollments,weighted_average'})
+    assert_parity(STUDENTS_API_ROOT, {'exclude': 'enrollments'})
+
+
+def test_student_pagination_parity(enrolled_student):
+    params = {'ordering': '-weighted_average', 'page_size': 1}
+    r = assert_parity(STUDENTS_API_ROOT, params)
+    while r.json()['next']:
+        r = assert_parity(r.json()['next'])
+
+
+def test_student_retrieve_parity(enrolled_student):
+    r = assert_parity(path_for_student(enrolled_student))
+    assert len(r.json()['enrollments']) == 2
+    assert_parity(path_for_student(enrolled_student), {'fields': 'name,enrollments'})
+    assert_parity(STUDENTS_API_ROOT + '000000000000000000000000/')
+
+
+def test_course_parity(course, second_course):
+    assert_parity(COURSES_API_ROOT)
+    assert_parity(COURSES_API_ROOT, {'minimal_points': 4, 'page_size': 1})
+    assert_parity(path_for_course(second_course))
+    assert_parity(COURSES_API_ROOT + '000000000000000000000000/')
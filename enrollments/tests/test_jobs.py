@@ -0,0 +1,54 @@
+'''
+Job runner tests. They need runners of their own, so they run in-process against the configured database
+instead of through the server.
+'''
+import datetime
+
+import pytest
+from bson import json_util
+
+from enrollments.jobs import JobRunner
+from enrollments.models import JOB_DONE, JOB_RUNNING, Course, Job, Student
+
+
+@pytest.fixture
+def course():
+    course = Course(faculty='Computer Science', subject='Compilers', description='Parsing', year=2017, semester='2',
+                    points=4).save()
+    yield course
+    course.delete()
+
+
+@pytest.fixture
+def students():
+    students = [Student(name='Runner %d' % i, city='Haifa', email='runner%d@aa.aa' % i, year_of_birth=1990).save()
+                for i in range(3)]
+    yield students
+    for student in students:
+        student.delete()
+
+
+def test_stale_job_resumed(course, students):
+    # A worker enrolled the first student and stopped
+    Student.objects(id=students[0].id).enrol(course)
+    job = Job(kind='bulk_enrol', params={'course': str(course.pk)}, total=len(students),
+              query=json_util.dumps({'_id': {'$in': [student.id for student in students]}}),
+              status=JOB_RUNNING, owner='stopped', attempts=1, last_id=students[0].id, processed=1, modified=1,
+              heartbeat_at=datetime.datetime.utcnow()).save()
+    try:
+        runner = JobRunner(chunk_size=1, stale_seconds=60)
+        runner.owner = 'resuming'
+        assert runner.claim(job.id) is None
+
+        Job.objects(id=job.id).update_one(set__heartbeat_at=datetime.datetime.utcnow() - datetime.timedelta(minutes=5))
+        claimed = runner.claim(job.id)
+        assert (claimed.owner, claimed.attempts) == ('resuming', 2)
+        runner.run(claimed)
+
+        job = Job.objects.get(id=job.id)
+        assert (job.status, job.processed, job.modified, job.errors) == (JOB_DONE, 3, 3, [])
+        assert Student.objects(id__in=[student.id for student in students], enrollments__course=course).count() == 3
+        # The first student was not enrolled twice
+        assert len(Student.objects.get(id=students[0].id).enrollments) == 1
+    finally:
+        Job.objects(id=job.id).delete()
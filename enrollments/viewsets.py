@@ -1,21 +1,56 @@
+from django.conf import settings
+from mongoengine import ValidationError as MongoValidationError
 from rest_framework import status
 from rest_framework.decorators import detail_route, list_route
+from rest_framework.exceptions import ValidationError
+from rest_framework.parsers import JSONParser
 from rest_framework.permissions import AllowAny
 from rest_framework.response import Response
+from rest_framework.reverse import reverse
 from rest_framework.status import HTTP_410_GONE
 from rest_framework_mongoengine import viewsets
 
-from enrollments.models import Course, Student
-from enrollments.serializers import CourseSerializer, StudentSerializer
+from enrollments.bulk import BulkCreateMixin
+from enrollments.cache import CachedResponseMixin, course_cache
+from enrollments.export import ExportMixin
+from enrollments.fast import FastReadMixin
+from enrollments.jobs import runner
+from enrollments.models import (Course, CourseStats, Enrollment, Job, Student, enrolled_course_ids,
+                                prefetch_courses)
+from enrollments.pagination import KeysetPagination, positive_int
+from enrollments.parsers import CSVParser
+from enrollments.routing import ReadRoutingMixin
+from enrollments.serializers import CourseSerializer, GradeSerializer, JobSerializer, StudentSerializer
+from enrollments.sparse import SparseFieldsMixin
+from enrollments.stats import grade_statistics
 
 
-class CourseViewSet(viewsets.ModelViewSet):
+def run_async(request):
+    return request.query_params.get('async') == '1'
+
+
+def job_accepted(job, request):
+    '''
+    202 ACCEPTED response for a submitted job, pointing to its progress.
+    '''
+    url = reverse('api:jobs-detail', kwargs={'id': job.pk}, request=request)
+    return Response(JobSerializer(job, context={'request': request}).data, status=status.HTTP_202_ACCEPTED,
+                    headers={'Location': url})
+
+
+class CourseViewSet(CachedResponseMixin, ReadRoutingMixin, SparseFieldsMixin, FastReadMixin, ExportMixin,
+                    BulkCreateMixin, viewsets.ModelViewSet):
     '''
     View, create, or update courses.
     '''
     lookup_field = 'id'
 
     serializer_class = CourseSerializer
+    pagination_class = KeysetPagination
+    cached_actions = ('list', 'retrieve')
+    # Stats rebuilt on read take two writes, a version read and an aggregation more
+    query_budgets = {'list': 1, 'retrieve': 1, 'create': 1, 'stats': 6, 'rollup_stats': 6}
+    secondary_read_actions = ('list', 'export')
 
     permission_classes = (AllowAny,)
 
@@ -24,24 +59,105 @@ class CourseViewSet(viewsets.ModelViewSet):
         minimal_points = self.request.query_params.get('minimal_points', None)
         if minimal_points is not None:
             queryset = queryset.filter(points__gte=minimal_points)
-        return queryset
+        return self.sparse_queryset(self.route_reads(queryset))
+
+    def perform_update(self, serializer):
+        snapshot = Enrollment.snapshot(serializer.instance)
+        course = serializer.save()
+        if Enrollment.snapshot(course) != snapshot:
+            Student.objects.update_course_snapshot(course)
+        if course.points != snapshot['points']:
+            Student.objects(enrollments__course=course).rebuild_averages()
 
     def destroy(self, request, *args, **kwargs):
+        '''
+        Delete a course, removing it from the enrollments of all students.
+
+        Returns the number of students that were enrolled to it.
+        Pass async=1 to run it as a background job instead, its progress is at the returned job.
+        '''
         course = self.get_object()
-        students = course.get_enrolled_students(Student.objects.all())
+        if run_async(request):
+            job = runner.submit('destroy_course', {'course': str(course.pk)},
+                                total=Student.objects(enrollments__course=course).count())
+            return job_accepted(job, request)
+        affected_students = Student.objects.de_enrol(course)
+        self.perform_destroy(course)
+        return Response({'affected_students': affected_students})
 
-        def de_enrol(student):
-            for enrollment in filter(lambda enrollment: enrollment.course == course, student.enrollments):
-                student.enrollments.remove(enrollment)
-            student.save()
+    @detail_route(methods=['post'], permission_classes=[AllowAny], parser_classes=[JSONParser, CSVParser])
+    def grades(self, request, id=None):
+        '''
+        Set the grades of many students in a course, from a JSON array or a CSV body of student and grade rows.
 
-        map(de_enrol, students)
+        The whole batch is validated first and nothing is written unless every row is valid.
+        Returns a report with the previous and new grade of every row, or the errors of the invalid rows.
+        '''
+        course = self.get_object()
+        rows = request.data
+        if not isinstance(rows, list):
+            return Response(data={'error': 'Expected a list of rows', 'details': ''},
+                            status=status.HTTP_400_BAD_REQUEST)
 
-        self.perform_destroy(course)
-        return Response(status=status.HTTP_204_NO_CONTENT)
+        results = []
+        for index, row in enumerate(rows):
+            try:
+                results.append(dict(GradeSerializer().run_validation(row), index=index))
+            except ValidationError as e:
+                results.append({'index': index, 'errors': e.detail})
+
+        valid = [result for result in results if 'errors' not in result]
+        previous_grades = Student.objects(id__in=[result['student'] for result in valid]).grades_in(course)
+        grades = {}
+        for result in valid:
+            if result['student'] in grades:
+                result['errors'] = {'student': ['Student appears more than once in the batch']}
+            elif result['student'] not in previous_grades:
+                result['errors'] = {'student': ['Student not enrolled to course %s' % course.pk]}
+            else:
+                grades[result['student']] = result['grade']
+                result['previous_grade'] = previous_grades[result['student']]
+            result['student'] = str(result['student'])
+
+        if any('errors' in result for result in results):
+            return Response(results, status=status.HTTP_400_BAD_REQUEST)
+        Student.objects.set_grades(course, grades)
+        return Response(results)
 
+    @detail_route(permission_classes=[AllowAny])
+    def stats(self, request, id=None):
+        '''
+        Get the grade distribution of a course: enrolled and graded students, mean, median and 90th percentile
+        grades, a histogram of 10 point buckets, and the points-weighted sums its grades add to student averages.
+        '''
+        course = self.get_object()
+        stats = CourseStats.objects.for_courses([course.pk])[course.pk]
+        data = grade_statistics([(stats, course.points)])
+        data['course'] = str(course.pk)
+        return Response(data)
 
-class StudentViewSet(viewsets.ModelViewSet):
+    @list_route(permission_classes=[AllowAny], url_path='stats')
+    def rollup_stats(self, request):
+        '''
+        Get the grade distribution of all the courses matching the faculty, year and semester parameters,
+        as for a single course.
+        '''
+        filters = dict((name, request.query_params[name]) for name in ('faculty', 'year', 'semester')
+                       if name in request.query_params)
+        try:
+            points = dict(self.get_queryset().filter(**filters).scalar('id', 'points'))
+        except ValueError as e:
+            return Response(data={'error': 'Invalid filters', 'details': e.message},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        stats = CourseStats.objects.for_courses(list(points))
+        data = grade_statistics([(stats[course_id], course_points) for course_id, course_points in points.items()])
+        data['courses'] = len(points)
+        return Response(data)
+
+
+class StudentViewSet(CachedResponseMixin, ReadRoutingMixin, SparseFieldsMixin, FastReadMixin, ExportMixin,
+                     BulkCreateMixin, viewsets.ModelViewSet):
     '''
     View, create, or update students.
 
@@ -51,13 +167,52 @@ class StudentViewSet(viewsets.ModelViewSet):
           description: Partial student name.
           required: false
           type: string
+        - name: name_prefix
+          in: query
+          description: Case-insensitive student name prefix, uses an index.
+          required: false
+          type: string
+        - name: city_prefix
+          in: query
+          description: Case-insensitive student city prefix, uses an index.
+          required: false
+          type: string
+        - name: q
+          in: query
+          description: Full-text search over student name and city.
+          required: false
+          type: string
+        - name: fields
+          in: query
+          description: Comma separated fields to return, others are not loaded.
+          required: false
+          type: string
+        - name: exclude
+          in: query
+          description: Comma separated fields to leave out, they are not loaded.
+          required: false
+          type: string
 
     '''
     lookup_field = 'id'
     serializer_class = StudentSerializer
+    pagination_class = KeysetPagination
+    cursor_ordering_fields = ('weighted_average',)
+    cached_actions = ('list', 'retrieve', 'outstanding', 'valedictorian', 'ranking', 'enrolled')
+    # Round trips per action, enrollments are serialized from their course snapshots without reading the courses
+    query_budgets = {'list': 1, 'retrieve': 1, 'valedictorian': 1, 'ranking': 3, 'enrol': 3, 'grade': 5}
+    secondary_read_actions = ('list', 'outstanding', 'valedictorian', 'ranking', 'enrolled', 'export')
+    # Query parameters of the ranking action selecting the courses it counts, and their course fields
+    ranking_scope_params = (('course', 'id'), ('faculty', 'faculty'), ('year', 'year'), ('semester', 'semester'))
 
     permission_classes = (AllowAny,)
 
+    def response_is_cached(self, request, action):
+        # Scoped rankings depend on the courses matching the scope, whose changes don't invalidate students
+        if action == 'ranking' and any(param in request.GET for param, _ in self.ranking_scope_params):
+            return False
+        return super(StudentViewSet, self).response_is_cached(request, action)
+
     def get_queryset(self):
         queryset = Student.objects.all()
         name = self.request.query_params.get('name', None)
@@ -67,29 +222,52 @@ class StudentViewSet(viewsets.ModelViewSet):
         if city is not None:
             queryset = queryset.filter(city__contains=city)
 
+        name_prefix = self.request.query_params.get('name_prefix', None)
+        if name_prefix is not None:
+            queryset = queryset.filter(name_lower__startswith=name_prefix.lower())
+        city_prefix = self.request.query_params.get('city_prefix', None)
+        if city_prefix is not None:
+            queryset = queryset.filter(city_lower__startswith=city_prefix.lower())
+        search = self.request.query_params.get('q', None)
+        if search:
+            queryset = queryset.search_text(search)
+
         minimal_year = self.request.query_params.get('minimal_year', None)
         if minimal_year is not None:
             queryset = queryset.filter(year_of_birth__gte=minimal_year)
 
-        return queryset
+        return self.sparse_queryset(self.route_reads(queryset))
 
-    def get_outstanding_students(self, minimum_score=1):
-        def calc_score(student):
-            sum = 0
-            points = 0
-            for enrollment in student.enrollments:
-                sum += enrollment.grade * enrollment.course.points
-                points += enrollment.course.points
-            if points > 0:
-                return student, sum / points
-            else:
-                return student, 0
+    def prepare_bulk_documents(self, students):
+        for student in prefetch_courses(students):
+            if student.enrollments:
+                student.recalculate_average()
+        return students
+
+    def bulk_documents_inserted(self, students):
+        CourseStats.objects.invalidate(enrolled_course_ids(students))
+
+    def perform_create(self, serializer):
+        student = serializer.save()
+        if student.enrollments:
+            student.recalculate_average()
+            student.save()
+            CourseStats.objects.invalidate(enrolled_course_ids([student]))
+
+    def perform_update(self, serializer):
+        previous_courses = enrolled_course_ids([serializer.instance])
+        student = serializer.save()
+        if 'enrollments' in serializer.validated_data:
+            student.recalculate_average()
+            student.save()
+            CourseStats.objects.invalidate(previous_courses | enrolled_course_ids([student]))
+
+    def perform_destroy(self, instance):
+        instance.delete()
+        CourseStats.objects.invalidate(enrolled_course_ids([instance]))
 
-        student_scores = map(calc_score, self.get_queryset())
-        high_student_scores = filter(lambda student_scores: student_scores[1] >= minimum_score, student_scores)
-        high_student_scores = sorted(high_student_scores, key=lambda x: x[1], reverse=True)
-        just_high_students = map(lambda student_score: student_score[0], high_student_scores)
-        return just_high_students
+    def get_outstanding_students(self, minimum_score=1):
+        return self.get_queryset().outstanding(minimum_score=minimum_score)
 
     @list_route(permission_classes=[AllowAny])
     def outstanding(self, request):
@@ -106,17 +284,49 @@ class StudentViewSet(viewsets.ModelViewSet):
 
         410 GONE will be returned if there's no qualifying student
         '''
-        outstanding_students = self.get_outstanding_students()
-        if not outstanding_students:
+        valedict = self.get_outstanding_students().first()
+        if valedict is None:
             return Response({}, status=HTTP_410_GONE)
-        valedict = outstanding_students[0]
         return Response(self.get_serializer(valedict).data)
 
+    @list_route(permission_classes=[AllowAny])
+    def ranking(self, request):
+        '''
+        Get the top k students by weighted grade average, best first. Students with equal averages
+        are ordered by id.
+
+        Pass k (10 by default) and min_score to filter the averages. Pass course, faculty, year or semester
+        to rank by the average of the grades in the matching courses only.
+        Returns the rank, score and student of every ranked student.
+        '''
+        scope = dict((field, request.query_params[param]) for param, field in self.ranking_scope_params
+                     if param in request.query_params)
+        courses = Course.objects(**scope) if scope else None
+        try:
+            k = positive_int(request.query_params.get('k', 10), cutoff=settings.MAX_PAGE_SIZE)
+            min_score = request.query_params.get('min_score')
+            min_score = float(min_score) if min_score is not None else None
+            ranked = self.get_queryset().ranking(k, min_score=min_score, courses=courses)
+        except (ValueError, MongoValidationError) as e:
+            return Response(data={'error': 'Invalid ranking parameters', 'details': e.message},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        students = self.get_queryset().in_bulk([student_id for student_id, _ in ranked])
+        # A student deleted since it was ranked is skipped
+        ranked = [(students[student_id], score) for student_id, score in ranked if student_id in students]
+        serializer = self.get_serializer([student for student, _ in ranked], many=True)
+        return Response([{'rank': rank, 'score': score, 'student': data}
+                         for rank, ((_, score), data) in enumerate(zip(ranked, serializer.data), 1)])
+
     @list_route(methods=['post'], permission_classes=[AllowAny])
     def bulk_enrol(self, request, **kwargs):
         '''
         Bulk enroll all students, filtering applies.
         Pass course={course-id} in the query to point to a course.
+
+        Returns the number of students matching the filters and the number of students actually enrolled.
+        Pass echo=1 to also get the filtered students enrolled to the course.
+        Pass async=1 to enrol them in chunks as a background job instead, its progress is at the returned job.
         '''
         course_id = request.query_params.get('course')
         try:
@@ -125,13 +335,24 @@ class StudentViewSet(viewsets.ModelViewSet):
             return Response(data={'error': 'Invalid course_id %s' % course_id, 'details': e.message},
                             status=status.HTTP_400_BAD_REQUEST)
 
-        def enrol_and_save(student):
-            student.enrol(course)
-            student.save()
+        students = self.get_queryset()
+        matched = students.count()
+        if run_async(request):
+            job = runner.submit('bulk_enrol', {'course': str(course.pk)}, students=students, total=matched)
+            return job_accepted(job, request)
 
-        map(enrol_and_save, self.get_queryset())
+        result = students.enrol(course)
+        data = {'matched': matched, 'modified': result.modified_count}
 
-        return Response(self.get_serializer(self.get_queryset(), many=True).data)
+        if request.query_params.get('echo'):
+            enrolled_students = course.get_enrolled_students(self.get_queryset())
+            page = self.paginate_queryset(enrolled_students)
+            if page is not None:
+                data['students'] = self.get_paginated_response(self.get_serializer(page, many=True).data).data
+            else:
+                data['students'] = self.get_serializer(enrolled_students, many=True).data
+
+        return Response(data)
 
     @list_route(permission_classes=[AllowAny])
     def enrolled(self, request, **kwargs):
@@ -142,7 +363,7 @@ class StudentViewSet(viewsets.ModelViewSet):
         '''
         course_id = request.query_params.get('course')
         try:
-            course = Course.objects.get(id=course_id)
+            course = course_cache.get(course_id)
         except Exception as e:
             return Response(data={'error': 'Invalid course_id %s' % course_id, 'details': e.message},
                             status=status.HTTP_400_BAD_REQUEST)
@@ -157,8 +378,6 @@ class StudentViewSet(viewsets.ModelViewSet):
         '''
         Enrol a student to a course. Course id should be passed via course query parameter
         '''
-        student = self.get_object()
-
         course_id = request.data.get('course')
         try:
             course = Course.objects.get(id=course_id)
@@ -166,12 +385,12 @@ class StudentViewSet(viewsets.ModelViewSet):
             return Response(data={'error': 'Invalid course_id %s' % course_id, 'details': e.message},
                             status=status.HTTP_400_BAD_REQUEST)
 
-        if course in student.enrolled_courses():
+        student = self.filter_queryset(self.get_queryset()).filter(id=id).modify_enrol(course)
+        if student is None:
+            self.get_object()
             return Response(data={'error': 'Student already enrolled to course %s' % course_id, 'details': ''},
                             status=status.HTTP_400_BAD_REQUEST)
 
-        student.enrol(course)
-        student.save()
         return Response(self.get_serializer(student).data)
 
     @detail_route(methods=['post'], permission_classes=[AllowAny], url_path='grade')
@@ -179,7 +398,6 @@ class StudentViewSet(viewsets.ModelViewSet):
         '''
         Set the grade for a given student. Pass grade and course id via request body
         '''
-        student = self.get_object()
         course_id = request.data.get('course')
         try:
             course = Course.objects.get(id=course_id)
@@ -187,11 +405,41 @@ class StudentViewSet(viewsets.ModelViewSet):
             return Response(data={'error': 'Invalid course_id %s' % course_id, 'details': e.message},
                             status=status.HTTP_400_BAD_REQUEST)
 
-        if course not in student.enrolled_courses():
+        try:
+            student = self.filter_queryset(self.get_queryset()).filter(id=id).modify_grade(
+                course, request.data.get('grade'))
+        except ValueError as e:
+            return Response(data={'error': 'Invalid grade %s' % request.data.get('grade'), 'details': e.message},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if student is None:
+            self.get_object()
             return Response(data={'error': 'Student not enrolled to course %s' % course_id, 'details': ''},
                             status=status.HTTP_400_BAD_REQUEST)
 
-        enrollment = filter(lambda enrollment: enrollment.course == course, student.enrollments)[0]
-        enrollment.grade = request.data.get('grade')
-        student.save()
         return Response(self.get_serializer(student).data)
+
+
+class JobViewSet(viewsets.ReadOnlyModelViewSet):
+    '''
+    Progress, counts and errors of the background jobs started with async=1.
+
+    parameters:
+        - name: status
+          in: query
+          description: One of pending, running, done or failed.
+          required: false
+          type: string
+
+    '''
+    lookup_field = 'id'
+    serializer_class = JobSerializer
+    pagination_class = KeysetPagination
+
+    permission_classes = (AllowAny,)
+
+    def get_queryset(self):
+        queryset = Job.objects.all()
+        job_status = self.request.query_params.get('status', None)
+        if job_status is not None:
+            queryset = queryset.filter(status=job_status)
+        return queryset
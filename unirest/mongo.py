@@ -0,0 +1,113 @@
+'''
+MongoDB connection settings read from the environment.
+
+MONGODB_HOST may be a host name, a mongodb:// URI (e.g. listing the members of a replica set
+with ?replicaSet=rs0), or mongomock://localhost to run against an in-memory mock.
+
+The connection is registered without connecting: every process creates its client on first use,
+and ForkSafeConnectionMiddleware replaces clients inherited from a parent by preforking servers.
+'''
+import os
+
+from mongoengine import Document, connection
+from mongoengine.base import _document_registry
+
+# Process that registered the connection, or last replaced it
+_connection_pid = None
+
+
+def env_int(name, default=None):
+    value = os.environ.get(name)
+    return int(value) if value else default
+
+
+def env_flag(name, default=False):
+    value = os.environ.get(name)
+    if not value:
+        return default
+    return value.lower() in ('1', 'true', 'yes', 'on')
+
+
+def write_concern(value):
+    # Either a number of members or a tag set name such as "majority"
+    return int(value) if value.isdigit() else value
+
+
+def connection_settings():
+    '''
+    Keyword arguments for mongoengine.connect, unset options keep the pymongo defaults.
+    '''
+    options = {
+        'db': os.environ.get('MONGODB_DB', 'unirest'),
+        'host': os.environ.get('MONGODB_HOST', 'localhost'),
+        'port': env_int('MONGODB_PORT', 32768),
+        'maxPoolSize': env_int('MONGODB_MAX_POOL_SIZE'),
+        'minPoolSize': env_int('MONGODB_MIN_POOL_SIZE'),
+        'connectTimeoutMS': env_int('MONGODB_CONNECT_TIMEOUT_MS'),
+        'socketTimeoutMS': env_int('MONGODB_SOCKET_TIMEOUT_MS'),
+        'serverSelectionTimeoutMS': env_int('MONGODB_SERVER_SELECTION_TIMEOUT_MS'),
+        'waitQueueTimeoutMS': env_int('MONGODB_WAIT_QUEUE_TIMEOUT_MS'),
+        'wtimeout': env_int('MONGODB_WTIMEOUT_MS'),
+        'username': os.environ.get('MONGODB_USERNAME'),
+        'password': os.environ.get('MONGODB_PASSWORD'),
+    }
+    if os.environ.get('MONGODB_WRITE_CONCERN'):
+        options['w'] = write_concern(os.environ['MONGODB_WRITE_CONCERN'])
+    if os.environ.get('MONGODB_REPLICA_SET'):
+        options['replicaSet'] = os.environ['MONGODB_REPLICA_SET']
+    if options['host'].startswith('mongomock://'):
+        # mongomock, from requirements-dev.txt, rejects the pymongo read preference mongoengine passes by default
+        from mongomock import read_preferences
+        options['read_preference'] = read_preferences.PRIMARY
+    return dict((name, value) for name, value in options.items() if value is not None)
+
+
+def register(options, **kwargs):
+    '''
+    Register the default mongoengine connection with options from connection_settings and kwargs,
+    without creating the client.
+    '''
+    global _connection_pid
+    options = dict(options, **kwargs)
+    connection.register_connection(connection.DEFAULT_CONNECTION_NAME, options.pop('db'), **options)
+    _connection_pid = os.getpid()
+
+
+def reset_collections():
+    '''
+    Forget the collections documents keep from the current clients.
+    '''
+    for document in list(_document_registry.values()):
+        if issubclass(document, Document):
+            document._collection = None
+
+
+def reset_after_fork():
+    '''
+    Drop the clients of the process the connection was registered in, when called from a forked child.
+    New clients are created on first use.
+
+    Returns whether they were dropped.
+    '''
+    global _connection_pid
+    if _connection_pid is None or _connection_pid == os.getpid():
+        return False
+    # Not closed: their sockets and monitor threads belong to the parent
+    connection._connections.clear()
+    connection._dbs.clear()
+    reset_collections()
+    _connection_pid = os.getpid()
+    return True
+
+
+class ForkSafeConnectionMiddleware(object):
+    '''
+    Makes every process use mongo clients of its own, even if the parent used the connection before forking.
+    '''
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        reset_after_fork()
+        return self.get_response(request)
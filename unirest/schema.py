@@ -0,0 +1,72 @@
+'''
+Swagger UI and OpenAPI schema of the API.
+
+The schema is generated at most once per process, instead of introspecting the router on every request,
+or read from API_SCHEMA_PATH when it was built ahead with ./manage.py build_schema.
+'''
+import os
+import threading
+
+from django.conf import settings
+from rest_framework import exceptions
+from rest_framework.permissions import AllowAny
+from rest_framework.response import Response
+from rest_framework.schemas import SchemaGenerator
+from rest_framework.views import APIView
+from rest_framework_swagger import renderers
+
+TITLE = 'Unirest API'
+
+_schema = None
+_lock = threading.Lock()
+
+
+def build_schema():
+    '''
+    Generate the OpenAPI schema of all the API routes, encoded as JSON.
+    '''
+    document = SchemaGenerator(title=TITLE).get_schema()
+    if not document:
+        raise exceptions.ValidationError('The schema generator did not return a schema Document')
+    openapi = renderers.OpenAPIRenderer()
+    return renderers.OpenAPICodec().encode(document, extra=openapi.get_customizations())
+
+
+def get_schema():
+    '''
+    The OpenAPI schema, read from API_SCHEMA_PATH if it exists, or built on first use.
+    '''
+    global _schema
+    if _schema is None:
+        with _lock:
+            if _schema is None:
+                path = getattr(settings, 'API_SCHEMA_PATH', None)
+                if path and os.path.exists(path):
+                    with open(path, 'rb') as schema_file:
+                        _schema = schema_file.read()
+                else:
+                    _schema = build_schema()
+    return _schema
+
+
+class CachedOpenAPIRenderer(renderers.OpenAPIRenderer):
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if isinstance(data, bytes):
+            return data
+        return super(CachedOpenAPIRenderer, self).render(data, accepted_media_type, renderer_context)
+
+
+class SchemaView(APIView):
+    '''
+    The Swagger UI, or with ?format=openapi the schema it is built from.
+    '''
+    _ignore_model_permissions = True
+    exclude_from_schema = True
+    permission_classes = [AllowAny]
+    renderer_classes = [CachedOpenAPIRenderer, renderers.SwaggerUIRenderer]
+
+    def get(self, request):
+        if request.accepted_renderer.format == CachedOpenAPIRenderer.format:
+            return Response(get_schema())
+        # The UI page loads the schema with ?format=openapi
+        return Response()
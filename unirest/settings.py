@@ -1,12 +1,16 @@
 import os
-import mongoengine
+import tempfile
 
-# IMPORTANT Change this to point to you mongodb service:
-mongoengine.connect(
-    db="unirest",
-    host="localhost",
-    port=32768,
-)
+from enrollments.instrumentation import command_recorder
+from unirest.mongo import connection_settings, env_flag, env_int, register
+
+# IMPORTANT Point MONGODB_HOST, MONGODB_PORT and MONGODB_DB to your mongodb service, see unirest/mongo.py
+MONGODB = connection_settings()
+register(MONGODB, event_listeners=[command_recorder])
+
+# Send the reads of reporting and list actions to secondaries, no further behind the primary than the staleness bound
+MONGODB_SECONDARY_READS = env_flag('MONGODB_SECONDARY_READS')
+MONGODB_MAX_STALENESS_SECONDS = env_int('MONGODB_MAX_STALENESS_SECONDS', 90)
 
 
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -35,10 +39,14 @@ INSTALLED_APPS = [
     'rest_framework_mongoengine',
     'rest_framework_swagger',
     'django_extensions',
-
+    'enrollments.apps.EnrollmentsConfig',
 ]
 
 MIDDLEWARE = [
+    'unirest.mongo.ForkSafeConnectionMiddleware',
+    'enrollments.jobs.JobRunnerMiddleware',
+    'enrollments.metrics.MetricsMiddleware',
+    'enrollments.instrumentation.MongoInstrumentationMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -116,5 +124,55 @@ STATIC_URL = '/static/'
 REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.AllowAny',
-    )
+    ),
+    'PAGE_SIZE': 100,
+}
+
+# Upper bound for the page_size query parameter of paginated list endpoints
+MAX_PAGE_SIZE = 1000
+
+# Number of documents fetched per round trip by the NDJSON export endpoints
+EXPORT_BATCH_SIZE = 1000
+
+# Number of documents written per insert_many by the bulk create endpoints
+BULK_CREATE_BATCH_SIZE = 1000
+
+# Cache of rendered GET responses, invalidated by mongoengine signals. Invalidations reach the other
+# worker processes only through a TOKENS cache they share, a CACHES alias such as a memcached one.
+# Without it, responses may be up to TIMEOUT seconds stale in the processes that didn't write.
+RESPONSE_CACHE = {
+    'BACKEND': 'enrollments.cache.LocMemLRUCache',
+    'OPTIONS': {
+        'max_entries': 1024,
+    },
+    'TIMEOUT': 30,
+    'TOKENS': None,
 }
+
+# Process-local cache of the courses looked up by id: maximum number of courses, and seconds they are kept.
+# Course writes of this process invalidate it, writes of other processes are seen once the courses expire.
+COURSE_CACHE_SIZE = 1024
+COURSE_CACHE_TTL = 60
+
+# JSON panel of the mongo commands of the latest requests at /debug/mongo/
+MONGO_DEBUG_PANEL = DEBUG
+MONGO_DEBUG_PANEL_SIZE = 50
+
+# What to do when a viewset action takes more round trips than its query_budgets allow: 'log' or 'raise'
+MONGO_QUERY_BUDGET_ACTION = 'log'
+
+# Per-process files the /metrics endpoint sums over, shared by all workers of a deployment.
+# Clear it when deploying, counters of processes that exited are kept until then.
+METRICS_DIR = os.path.join(tempfile.gettempdir(), 'unirest-metrics')
+METRICS_FLUSH_INTERVAL = 1.0
+
+# Background jobs of the ?async=1 bulk operations: worker threads per process, students per chunk,
+# seconds between polls for jobs to resume, and seconds without a heartbeat after which a running job is resumed
+JOB_WORKERS = 2
+JOB_CHUNK_SIZE = 1000
+JOB_POLL_INTERVAL = 5.0
+JOB_STALE_SECONDS = 60
+
+# OpenAPI schema served at /docs/?format=openapi, built ahead with ./manage.py build_schema.
+# Without the file the schema is generated on the first request of every process.
+API_SCHEMA_PATH = os.environ.get('API_SCHEMA_PATH')
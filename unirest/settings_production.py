@@ -0,0 +1,76 @@
+'''
+Settings of production workers, trimmed to what the API serves to boot faster:
+
+    $ DJANGO_SETTINGS_MODULE=unirest.settings_production ./manage.py build_schema
+    $ DJANGO_SETTINGS_MODULE=unirest.settings_production gunicorn --preload --workers 4 unirest.wsgi
+
+No admin, sessions, users or django_extensions: the API is anonymous. The Mongo connection is created
+in every worker on first use, so --preload is safe, and the OpenAPI schema is read from API_SCHEMA_PATH.
+'''
+import os
+
+from unirest.settings import *  # noqa: F401,F403
+from unirest.settings import BASE_DIR, RESPONSE_CACHE, REST_FRAMEWORK
+
+SECRET_KEY = os.environ.get('DJANGO_SECRET_KEY', SECRET_KEY)  # noqa: F405
+
+DEBUG = False
+
+ALLOWED_HOSTS = [host for host in os.environ.get('DJANGO_ALLOWED_HOSTS', '').split(',') if host]
+
+INSTALLED_APPS = [
+    'django.contrib.staticfiles',
+    'rest_framework',
+    'rest_framework_mongoengine',
+    'rest_framework_swagger',
+    'enrollments.apps.EnrollmentsConfig',
+]
+
+MIDDLEWARE = [
+    'unirest.mongo.ForkSafeConnectionMiddleware',
+    'enrollments.jobs.JobRunnerMiddleware',
+    'enrollments.metrics.MetricsMiddleware',
+    'enrollments.instrumentation.MongoInstrumentationMiddleware',
+    'django.middleware.security.SecurityMiddleware',
+    'django.middleware.common.CommonMiddleware',
+    'django.middleware.clickjacking.XFrameOptionsMiddleware',
+]
+
+TEMPLATES = [
+    {
+        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'DIRS': [],
+        'APP_DIRS': True,
+        'OPTIONS': {
+            'context_processors': [
+                'django.template.context_processors.request',
+            ],
+        },
+    },
+]
+
+AUTH_PASSWORD_VALIDATORS = []
+
+REST_FRAMEWORK = dict(
+    REST_FRAMEWORK,
+    DEFAULT_AUTHENTICATION_CLASSES=(),
+    UNAUTHENTICATED_USER=None,
+)
+
+SWAGGER_SETTINGS = {
+    'USE_SESSION_AUTH': False,
+}
+
+MONGO_DEBUG_PANEL = False
+
+# Share the response cache invalidations between workers through memcached, the backend uses python-memcached
+if os.environ.get('MEMCACHED_LOCATION'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.memcached.MemcachedCache',
+            'LOCATION': os.environ['MEMCACHED_LOCATION'],
+        },
+    }
+    RESPONSE_CACHE = dict(RESPONSE_CACHE, TOKENS='default')
+
+API_SCHEMA_PATH = os.environ.get('API_SCHEMA_PATH', os.path.join(BASE_DIR, 'openapi.json'))
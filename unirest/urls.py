@@ -13,25 +13,33 @@ Including another URLconf
     1. Import the include() function: from django.conf.urls import url, include
     2. Add a URL to urlpatterns:  url(r'^blog/', include('blog.urls'))
 """
+from django.apps import apps
 from django.conf.urls import url, include
-from django.contrib import admin
 
 from rest_framework_mongoengine import routers
 
 # this is DRF router for REST API viewsets
-from enrollments.viewsets import CourseViewSet, StudentViewSet
-from rest_framework_swagger.views import get_swagger_view
-
-swagger_view = get_swagger_view(title='Unirest API')
+from enrollments.instrumentation import mongo_debug_panel
+from enrollments.metrics import metrics
+from enrollments.viewsets import CourseViewSet, JobViewSet, StudentViewSet
+from unirest.schema import SchemaView
 
 router = routers.DefaultRouter()
 
 # register REST API endpoints with DRF router
 router.register(r'courses', CourseViewSet, r"courses")
 router.register(r'students', StudentViewSet, r"students")
+router.register(r'jobs', JobViewSet, r"jobs")
 
 urlpatterns = [
-    url(r'^admin/', admin.site.urls),
     url(r'^api/', include(router.urls, namespace='api')),
-    url(r'^docs/', swagger_view),
+    url(r'^docs/', SchemaView.as_view()),
+    url(r'^debug/mongo/$', mongo_debug_panel),
+    url(r'^metrics$', metrics),
 ]
+
+# Left out of the production settings
+if apps.is_installed('django.contrib.admin'):
+    from django.contrib import admin
+
+    urlpatterns.append(url(r'^admin/', admin.site.urls))